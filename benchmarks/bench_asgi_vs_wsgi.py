@@ -0,0 +1,74 @@
+"""
+Requests per second and latency percentiles of the sync (gunicorn + wsgi.py) and
+async (gunicorn + uvicorn worker + asgi.py) serving modes under the same load.
+
+    python benchmarks/bench_asgi_vs_wsgi.py --persons 10000 --concurrency 16 256 --workers 2
+
+Seeds the database once, then starts a server per mode and drives the read
+routes with loadgen.py. Prints one JSON document per (mode, concurrency).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+
+from loadgen import run  # noqa: E402
+
+PATHS = ["/persons?limit=20", "/favorites?limit=50", "/person/1", "/characters?limit=50",
+         "/planet/3", "/vehicles?limit=20&fields=id,name"]
+
+COMMANDS = {
+    "wsgi": ["gunicorn", "wsgi", "--chdir", "./src/"],
+    "asgi": ["gunicorn", "asgi", "--chdir", "./src/", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persons", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--modes", nargs="+", default=list(COMMANDS))
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:////tmp/bench.db")
+    subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--persons", str(args.persons)],
+                   check=True, env=env)
+
+    for mode in args.modes:
+        command = COMMANDS[mode] + ["-w", str(args.workers), "-b", f"127.0.0.1:{args.port}"]
+        server = subprocess.Popen(command, cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port)
+            run(f"http://127.0.0.1:{args.port}", PATHS, concurrency=4, duration=2)  # warm up
+            for concurrency in args.concurrency:
+                result = run(f"http://127.0.0.1:{args.port}", PATHS, concurrency, args.duration)
+                print(json.dumps({"mode": mode, "workers": args.workers, **result}), flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Gunicorn settings compared under the same load: worker class, worker count and
+preload, all started through gunicorn.conf.py with different environments.
+
+    python benchmarks/bench_gunicorn.py --concurrency 8 64 --duration 15 > gunicorn.json
+
+Per configuration: time from start to the first served request, memory of the
+master and its workers (PSS, so pages shared after a preload fork are counted
+once) and rps / p50 / p99 of the read routes per concurrency. Against SQLite the
+database round-trip is close to free, which understates what threaded and gevent
+workers gain; point DATABASE_URL at PostgreSQL for numbers that match production.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+
+from loadgen import run  # noqa: E402
+from bench_asgi_vs_wsgi import PATHS  # noqa: E402
+
+CONFIGS = {
+    "sync x1 (previous Procfile)": {"GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "1", "GUNICORN_PRELOAD": "0"},
+    "sync, default workers": {"GUNICORN_WORKER_CLASS": "sync"},
+    "sync, default workers, no preload": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_PRELOAD": "0"},
+    "gthread, default workers (default)": {},
+    "gthread, 8 threads": {"GUNICORN_THREADS": "8"},
+    "gevent": {"GUNICORN_WORKER_CLASS": "gevent"},
+}
+
+
+def wait_until_served(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/characters?limit=1", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def process_tree(pid):
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+
+def pss_mb(pid):
+    total = 0
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/smaps_rollup") as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+        except OSError:
+            pass
+    return round(total / 1024, 1)
+
+
+def available(config):
+    if config.get("GUNICORN_WORKER_CLASS") == "gevent":
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def bench(name, overrides, args, env):
+    env = {**env, **overrides}
+    started = time.perf_counter()
+    server = subprocess.Popen(["gunicorn", "-b", f"127.0.0.1:{args.port}"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_served(args.port)
+        result = {"config": name, "env": overrides, "boot_s": round(time.perf_counter() - started, 2)}
+        run(f"http://127.0.0.1:{args.port}", PATHS, concurrency=4, duration=2)  # warm up
+        result["load"] = [run(f"http://127.0.0.1:{args.port}", PATHS, concurrency, args.duration)
+                          for concurrency in args.concurrency]
+        result["pss_mb"] = pss_mb(server.pid)
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persons", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8125)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS))
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:////tmp/bench.db")
+    env["SERVER_MODE"] = "wsgi"
+    subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--persons", str(args.persons)],
+                   check=True, env=env)
+
+    for name in args.configs:
+        if not available(CONFIGS[name]):
+            print(json.dumps({"config": name, "skipped": "gevent is not installed"}), flush=True)
+            continue
+        print(json.dumps(bench(name, CONFIGS[name], args, env)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+`flask data import` throughput and memory at 1M rows, against ORM inserts one
+row at a time (what loading through Flask-Admin amounts to).
+
+    python benchmarks/bench_import.py --rows 1000000 --format csv > import.json
+
+The file is generated on disk first. Reported per run: rows/s and the growth of
+the peak RSS during the import, which should not depend on --rows. The second
+import of the same file measures the upsert path (every row conflicts). The ORM
+baseline runs on --orm-rows rows only and is extrapolated.
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from seed import app, seed  # noqa: E402
+from models import db, Character  # noqa: E402
+from importer import import_rows, read_records  # noqa: E402
+
+
+def write_file(path, rows, fmt):
+    with open(path, "w", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(["id", "name", "birthday"])
+            for i in range(1, rows + 1):
+                writer.writerow([i, f"Imported character {i}", f"{i % 1000}BBY"])
+        else:
+            for i in range(1, rows + 1):
+                f.write(json.dumps({"id": i, "name": f"Imported character {i}", "birthday": f"{i % 1000}BBY"}) + "\n")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed_import(path, fmt, batch_size):
+    before = peak_rss_mb()
+    started = time.perf_counter()
+    with app.app_context(), open(path, encoding="utf-8") as f:
+        count = import_rows(db.session, Character, read_records(f, fmt), batch_size)
+    elapsed = time.perf_counter() - started
+    return {"rows": count, "seconds": round(elapsed, 2), "rows_per_s": round(count / elapsed),
+            "peak_rss_growth_mb": round(peak_rss_mb() - before, 1)}
+
+
+def orm_baseline(rows):
+    with app.app_context():
+        db.session.execute(db.delete(Character))
+        db.session.commit()
+        started = time.perf_counter()
+        for i in range(1, rows + 1):
+            db.session.add(Character(character_id=i, character_name=f"Imported character {i}",
+                                     birthday_character=f"{i % 1000}BBY"))
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        db.session.execute(db.delete(Character))
+        db.session.commit()
+    return {"rows": rows, "seconds": round(elapsed, 2), "rows_per_s": round(rows / elapsed)}
+
+
+def run(rows=1000000, fmt="csv", batch_size=10000, orm_rows=2000):
+    seed(persons=10, catalog=1, favorites_per_person=0)
+    with app.app_context():
+        db.session.execute(db.delete(Character))
+        db.session.commit()
+        dialect = db.engine.dialect.name
+
+    results = {"meta": {"rows": rows, "format": fmt, "batch_size": batch_size, "dialect": dialect}}
+    results["orm_one_by_one"] = orm_baseline(orm_rows)
+    results["orm_one_by_one"]["extrapolated_seconds"] = round(rows / results["orm_one_by_one"]["rows_per_s"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"characters.{fmt}")
+        write_file(path, rows, fmt)
+        results["meta"]["file_mb"] = round(os.path.getsize(path) / 1024 / 1024, 1)
+        results["insert"] = timed_import(path, fmt, batch_size)
+        results["upsert"] = timed_import(path, fmt, batch_size)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--orm-rows", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.format, args.batch_size, args.orm_rows), indent=2))
@@ -0,0 +1,145 @@
+"""
+Drives every route of src/app.py through the Flask test client and reports,
+per route: requests per second, p50/p95/p99 latency and SQL statements per request.
+
+    python benchmarks/bench_routes.py --requests 200 > routes.json
+
+Write routes are measured in pairs with their undo (register then delete a
+favorite...) so the database stays the same size during the run; only the
+request under test is timed. A route without a scenario below is reported with
+"missing_scenario" so new endpoints cannot silently escape the suite.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from loadgen import percentile  # noqa: E402
+from seed import app  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from models import db  # noqa: E402
+
+
+def favorite(i, persons, catalog):
+    return {"person_id": i % persons + 1, "character_id": (i * 13) % catalog + 1,
+            "planet_id": (i * 17) % catalog + 1}
+
+
+def scenarios(persons, catalog):
+    """{(endpoint, method): fn(i) -> (setup, request, teardown)}, each one (method, url, json) or None."""
+    ids = itertools.count(persons + 1000000)
+    new_person = lambda i: {"person_id": next(ids), "nickname": f"bench{time.time_ns()}",  # noqa: E731
+                            "name": "Bench", "last_name": "Mark", "email": f"bench{time.time_ns()}@example.com"}
+    return {
+        ("sitemap", "GET"): lambda i: (None, ("GET", "/", None), None),
+        ("get_metrics", "GET"): lambda i: (None, ("GET", "/metrics", None), None),
+        ("handle_hello", "GET"): lambda i: (None, ("GET", "/user", None), None),
+        ("get_person", "GET"): lambda i: (None, ("GET", f"/person/{i % persons + 1}", None), None),
+        ("get_all_persons", "GET"): lambda i: (None, ("GET", "/persons?limit=50", None), None),
+        ("create_person", "POST"): lambda i: (None, ("POST", "/login/person", new_person(i)), None),
+        ("get_all_favorites", "GET"): lambda i: (None, ("GET", "/favorites?limit=100", None), None),
+        ("register_favorities", "POST"): lambda i: (
+            None, ("POST", "/favorites/register", favorite(i, persons, catalog)),
+            ("DELETE", "/favorites", favorite(i, persons, catalog))),
+        ("delete_favorite", "DELETE"): lambda i: (
+            ("POST", "/favorites/register", favorite(i, persons, catalog)),
+            ("DELETE", "/favorites", favorite(i, persons, catalog)), None),
+        ("register_favorites_bulk", "POST"): lambda i: (
+            None, ("POST", "/favorites/bulk", {"favorites": [favorite(i * 20 + n, persons, catalog) for n in range(20)]}),
+            ("DELETE", "/favorites/bulk", {"favorites": [favorite(i * 20 + n, persons, catalog) for n in range(20)]})),
+        ("delete_favorites_bulk", "DELETE"): lambda i: (
+            ("POST", "/favorites/bulk", {"favorites": [favorite(i * 20 + n, persons, catalog) for n in range(20)]}),
+            ("DELETE", "/favorites/bulk", {"favorites": [favorite(i * 20 + n, persons, catalog) for n in range(20)]}), None),
+        ("get_top_favorited", "GET"): lambda i: (
+            None, ("GET", f"/stats/top/{('characters', 'planets', 'vehicles', 'persons')[i % 4]}?limit=10", None), None),
+        ("get_person_stats", "GET"): lambda i: (None, ("GET", "/stats/persons?limit=100", None), None),
+        ("get_all_character", "GET"): lambda i: (None, ("GET", "/characters?limit=100", None), None),
+        ("get_character_id", "GET"): lambda i: (None, ("GET", f"/character/{i % catalog + 1}", None), None),
+        ("get_all_vehicle", "GET"): lambda i: (None, ("GET", "/vehicles?limit=100", None), None),
+        ("get_vehicle_id", "GET"): lambda i: (None, ("GET", f"/vehicle/{i % catalog + 1}", None), None),
+        ("get_all_planet", "GET"): lambda i: (None, ("GET", "/planets?limit=100", None), None),
+        ("get_planet_id", "GET"): lambda i: (None, ("GET", f"/planet/{i % catalog + 1}", None), None),
+        ("batch_lookup", "POST"): lambda i: (None, ("POST", "/batch", {"requests": [
+            {"type": kind, "id": (i + n) % catalog + 1}
+            for n, kind in enumerate(("character", "planet", "vehicle", "person") * 5)]}), None),
+    }
+
+
+def app_routes():
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == "static" or rule.endpoint.startswith(("admin", "static")) or "." in rule.endpoint:
+            continue
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            yield rule.endpoint, method, rule.rule
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+def send(client, call):
+    method, url, body = call
+    return client.open(url, method=method, json=body)
+
+
+def bench_route(client, counter, scenario, requests):
+    latencies, queries, statuses = [], 0, {}
+    for i in range(requests):
+        setup, call, teardown = scenario(i)
+        if setup:
+            send(client, setup)
+        before = counter.count
+        started = time.perf_counter()
+        response = send(client, call)
+        latencies.append(time.perf_counter() - started)
+        queries += counter.count - before
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if teardown:
+            send(client, teardown)
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": round(requests / sum(latencies), 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_request": round(queries / requests, 2),
+    }
+
+
+def run(requests=200, persons=1000, catalog=100):
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+    client = app.test_client()
+    table = scenarios(persons, catalog)
+    results = {}
+    for endpoint, method, rule in app_routes():
+        key = f"{method} {rule}"
+        scenario = table.get((endpoint, method))
+        if scenario is None:
+            results[key] = {"missing_scenario": True}
+            continue
+        bench_route(client, counter, scenario, min(10, requests))  # warm up caches
+        results[key] = bench_route(client, counter, scenario, requests)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--persons", type=int, default=1000, help="must match the seeded database")
+    parser.add_argument("--catalog", type=int, default=100, help="must match the seeded database")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.persons, args.catalog), indent=2))
@@ -0,0 +1,124 @@
+"""
+Server-side catalog search (?q= and filters) against what clients did before:
+download every page of the collection and filter locally.
+
+    python benchmarks/bench_search.py --catalog 100000 --lookups 50 > search.json
+
+Reports, per approach, the latency of one lookup (p50/p95) and the bytes sent.
+The catalog and response caches are cleared before every request so both sides
+pay for their SQL; pass --warm to measure repeat lookups instead.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from loadgen import percentile  # noqa: E402
+from seed import app, seed  # noqa: E402
+from cache import catalog_cache  # noqa: E402
+from conditional import response_cache  # noqa: E402
+from models import db, Character  # noqa: E402
+from search import fts_table  # noqa: E402
+
+
+def get(client, url, warm):
+    if not warm:
+        catalog_cache.local.clear()
+        response_cache.clear()
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    return response
+
+
+def download_everything(client, collection, match, warm):
+    """Every page of `collection`, filtered client side."""
+    found, sent, after = [], 0, None
+    while True:
+        response = get(client, f"/{collection}?limit=1000" + (f"&after={after}" if after else ""), warm)
+        sent += len(response.data)
+        data = response.get_json()
+        found += [item for item in data[collection] if match(item)]
+        after = data["next"]
+        if after is None:
+            return found, sent
+
+
+def server_side(client, collection, query, warm):
+    found, sent, after = [], 0, None
+    while True:
+        response = get(client, f"/{collection}?{query}" + (f"&after={after}" if after else ""), warm)
+        sent += len(response.data)
+        data = response.get_json()
+        found += data[collection]
+        after = data["next"]
+        if after is None:
+            return found, sent
+
+
+def lookups(catalog, count):
+    """(name, collection, query string, local predicate)"""
+    rng = random.Random(42)
+    for _ in range(count):
+        i = rng.randint(1, catalog)
+        term = f"ter {i}"
+        yield ("substring", "characters", f"q={term}", lambda item, t=term: t.lower() in item["name"].lower())
+        term = f"Planet {i}"
+        yield ("prefix", "planets", f"q={term}*", lambda item, t=term: item["name"].lower().startswith(t.lower()))
+        low = i * 1000
+        yield ("range", "planets", f"surfice_min={low}&surfice_max={low + 50000}",
+               lambda item, lo=low: lo <= item["surfice"] <= lo + 50000)
+        model = f"Model {i % 50}"
+        yield ("equality", "vehicles", f"model={model}", lambda item, m=model: item["model"] == m)
+
+
+def measure(calls):
+    latencies, sent = [], 0
+    for call in calls:
+        started = time.perf_counter()
+        _, size = call()
+        latencies.append(time.perf_counter() - started)
+        sent += size
+    latencies.sort()
+    return {
+        "lookups": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "bytes_per_lookup": sent // len(latencies),
+    }
+
+
+def run(catalog=10000, count=20, warm=False, reseed=True):
+    if reseed:
+        seed(persons=10, catalog=catalog, favorites_per_person=1)
+    client = app.test_client()
+    with app.app_context():
+        results = {"meta": {"catalog": catalog, "warm": warm, "dialect": db.engine.dialect.name,
+                            "name_index": db.engine.dialect.name == "postgresql"
+                            or fts_table(Character, db.engine) is not None}}
+
+    cases = {}
+    for name, collection, query, match in lookups(catalog, count):
+        case = cases.setdefault(name, {"download": [], "server": []})
+        case["download"].append(lambda c=collection, m=match: download_everything(client, c, m, warm))
+        case["server"].append(lambda c=collection, q=query: server_side(client, c, q, warm))
+
+    for name, case in cases.items():
+        # both sides must find the same rows
+        for download, server in zip(case["download"][:3], case["server"][:3]):
+            assert download()[0] == server()[0], name
+        results[name] = {"download_everything": measure(case["download"]), "server_side": measure(case["server"])}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=20, help="per kind of lookup")
+    parser.add_argument("--warm", action="store_true", help="keep the catalog and response caches")
+    args = parser.parse_args()
+    print(json.dumps(run(args.catalog, args.lookups, args.warm), indent=2))
@@ -0,0 +1,98 @@
+"""
+Micro-benchmarks of the serialize / serialize_with_relations methods of every model,
+of the row serializers the list endpoints use instead, and of the JSON providers.
+
+    python benchmarks/bench_serializers.py --rows 1000 > serializers.json
+
+Instances (and the relations the methods walk) are loaded up front, so the
+numbers are pure serialization cost: microseconds per call, best of --repeat.
+Row serializers are timed including their queries, as that is what they replace
+(instance loading plus the serialize method).
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from seed import app  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from models import db, Character  # noqa: E402
+from json_provider import OrjsonProvider, orjson  # noqa: E402
+from serializers import ColumnSerializer, FavoriteSerializer, PersonSerializer  # noqa: E402
+
+
+def loaded(model, rows):
+    options = []
+    for relationship in model.__mapper__.relationships:
+        target = relationship.mapper.class_
+        # serialize_with_relations goes one level further (favorite -> catalog rows)
+        nested = [selectinload(getattr(target, n.key)) for n in relationship.mapper.relationships]
+        options.append(selectinload(getattr(model, relationship.key)).options(*nested))
+    return db.session.scalars(db.select(model).options(*options).limit(rows)).all()
+
+
+def fetch(serializer, rows):
+    page = db.session.execute(serializer.select().order_by("_cursor").limit(rows)).all()
+    related = serializer.related_select(page)
+    return serializer.serialize_rows(page, db.session.execute(related).all() if related is not None else None)
+
+
+def row_serializers(rows, repeat):
+    results = {}
+    for name, serializer in (("ColumnSerializer(Character)", ColumnSerializer(Character)),
+                             ("FavoriteSerializer", FavoriteSerializer()),
+                             ("PersonSerializer", PersonSerializer())):
+        count = len(fetch(serializer, rows))
+        if not count:
+            continue
+        best = min(timeit.repeat(lambda: fetch(serializer, rows), number=1, repeat=repeat))
+        results[name] = {"rows": count, "us_per_row": round(best / count * 1e6, 3)}
+    return results
+
+
+def json_providers(rows, repeat):
+    data = {"list_persons": fetch(PersonSerializer(), rows), "next": None}
+    providers = [("DefaultJSONProvider", DefaultJSONProvider(app))]
+    if orjson is not None:
+        providers.append(("OrjsonProvider", OrjsonProvider(app)))
+    results = {}
+    for name, provider in providers:
+        best = min(timeit.repeat(lambda: provider.dumps(data), number=1, repeat=repeat))
+        results[name] = {"bytes": len(provider.dumps(data)), "ms_per_dump": round(best * 1000, 3)}
+    return results
+
+
+def run(rows=1000, repeat=5):
+    results = {}
+    with app.app_context():
+        for mapper in db.Model.registry.mappers:
+            model = mapper.class_
+            instances = loaded(model, rows)
+            if not instances:
+                continue
+            for name in sorted(vars(model)):
+                if not name.startswith("serialize"):
+                    continue
+                method = getattr(model, name)
+                best = min(timeit.repeat(lambda: [method(item) for item in instances],
+                                         number=1, repeat=repeat))
+                results[f"{model.__name__}.{name}"] = {
+                    "rows": len(instances),
+                    "us_per_call": round(best / len(instances) * 1e6, 3),
+                }
+        results["rows"] = row_serializers(rows, repeat)
+        results["json"] = json_providers(rows, repeat)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
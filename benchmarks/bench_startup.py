@@ -0,0 +1,93 @@
+"""
+Cold start of a worker: import time of the app and time to its first request.
+
+    python benchmarks/bench_startup.py --runs 10 > startup.json
+
+Every run is a fresh interpreter that imports src/app.py, serves GET /characters
+and then GET /admin/ through the test client (Flask-Admin is built on that first
+/admin request, see src/admin.py). Reported: p50/p95 of the import, of the first
+API request and of the whole process (interpreter start included, what a
+gunicorn worker or a serverless cold start waits for), the slowest modules
+imported by app.py (one extra run under `python -X importtime`) and whether
+flask_admin / alembic were imported before the first API request.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+sys.path.insert(0, HERE)
+
+from loadgen import percentile  # noqa: E402
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+assert client.get("/characters?limit=10").status_code == 200
+served = time.perf_counter()
+heavy = sorted(m for m in ("flask_admin", "wtforms", "alembic", "flask_migrate") if m in sys.modules)
+assert client.get("/admin/").status_code == 200
+admin = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": served - imported,
+                  "admin_first_request": admin - served, "heavy_modules": heavy}))
+"""
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def child(*flags):
+    started = time.perf_counter()
+    done = subprocess.run([sys.executable, *flags, "-c", CHILD], cwd=SRC, env=os.environ,
+                          capture_output=True, text=True, check=True)
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - started
+    return result, done.stderr
+
+
+def slowest_imports(stderr, count):
+    """Modules imported directly by app.py, by cumulative import time."""
+    modules, children = [], []
+    # a module is listed after its imports, which are indented one level deeper
+    for match in IMPORTTIME.finditer(stderr):
+        _, cumulative, indent, name = match.groups()
+        if len(indent) == 3:
+            children.append({"module": name, "cumulative_ms": round(int(cumulative) / 1000, 1)})
+        elif len(indent) == 1:
+            if name == "app":
+                modules = children
+            children = []
+    return sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:count]
+
+
+def summary(values):
+    values = sorted(values)
+    return {"p50_ms": round(percentile(values, 50) * 1000, 1), "p95_ms": round(percentile(values, 95) * 1000, 1)}
+
+
+def run(runs=10, reseed=True):
+    if reseed:
+        from seed import seed
+        seed(persons=10, catalog=100, favorites_per_person=1)
+    results = [child()[0] for _ in range(runs)]
+    _, stderr = child("-X", "importtime")
+    return {
+        "meta": {"runs": runs, "heavy_modules_before_first_request": results[-1]["heavy_modules"]},
+        **{key: summary([r[key] for r in results])
+           for key in ("import", "first_request", "admin_first_request", "process")},
+        "slowest_imports": slowest_imports(stderr, 10),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.runs), indent=2))
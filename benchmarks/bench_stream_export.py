@@ -0,0 +1,67 @@
+"""
+Peak RSS of exporting /persons and /favorites as NDJSON (?stream=1) compared
+with building the same payload through jsonify in one response.
+
+    python benchmarks/bench_stream_export.py --rows 10000 100000 1000000
+
+Every measurement runs in a fresh subprocess so ru_maxrss is not polluted by
+the previous run. Output is one JSON document per measurement.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(route, mode):
+    sys.path.insert(0, HERE)
+    from seed import app  # noqa: E402  (seed sets DATABASE_URL and sys.path)
+
+    client = app.test_client()
+    url = f"{route}?stream=1" if mode == "stream" else f"{route}?limit={10 ** 12}"
+    started = time.perf_counter()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return {
+        "route": route,
+        "mode": mode,
+        "bytes": size,
+        "seconds": round(time.perf_counter() - started, 3),
+        # kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="number of persons (each gets 3 favorites)")
+    parser.add_argument("--modes", nargs="+", default=["stream", "jsonify"])
+    parser.add_argument("--routes", nargs="+", default=["/persons", "/favorites"])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--persons", str(rows),
+                        "--catalog", "1000"], check=True)
+        for route in args.routes:
+            for mode in args.modes:
+                # the API caps ?limit=, lift the cap for the jsonify baseline
+                env = dict(os.environ, API_PAGE_MAX_LIMIT=str(10 ** 12))
+                out = subprocess.run([sys.executable, __file__, "--measure", route, mode],
+                                     env=env, check=True, capture_output=True, text=True)
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                result["rows"] = rows
+                print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+    else:
+        main()
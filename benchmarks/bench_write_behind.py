@@ -0,0 +1,121 @@
+"""
+POST /favorites/register and DELETE /favorites committed per request against
+the write-behind queue (src/write_behind.py), with and without ?wait=1.
+
+    python benchmarks/bench_write_behind.py --threads 16 --duration 10 > write_behind.json
+
+Every mode runs in its own process (FAVORITES_WRITE_BEHIND is read at import)
+with --threads closed-loop clients on the Flask test client, each registering
+and deleting favorites of its own persons. Per mode: requests/s and p50/p99 of
+the requests, database commits and commits/s, mutations applied per commit, and
+the time the queue took to drain after the load stopped (counted in
+applied_per_s). Against SQLite a commit is an fsync of the whole file; on
+PostgreSQL it is a WAL flush, point DATABASE_URL at one for production numbers.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+MODES = {
+    "sync": ({"FAVORITES_WRITE_BEHIND": "0"}, ""),
+    "write_behind": ({"FAVORITES_WRITE_BEHIND": "1"}, ""),
+    "write_behind_wait": ({"FAVORITES_WRITE_BEHIND": "1"}, "?wait=1"),
+}
+
+
+def client_loop(app, thread, threads, persons, catalog, suffix, deadline, latencies, statuses):
+    client = app.test_client()
+    i = 0
+    while time.perf_counter() < deadline:
+        # persons are split between the threads, a favorite is registered then deleted
+        person_id = (thread + threads * (i // 2 % max(1, persons // threads))) % persons + 1
+        body = {"person_id": person_id, "character_id": (i // 2 * 7 + thread) % catalog + 1}
+        method = "POST" if i % 2 == 0 else "DELETE"
+        url = "/favorites/register" if i % 2 == 0 else "/favorites"
+        started = time.perf_counter()
+        response = client.open(url + suffix, method=method, json=body)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        i += 1
+
+
+def child(args):
+    from seed import app
+    from sqlalchemy import event
+    from loadgen import percentile
+    from models import db
+    from write_behind import WRITE_BEHIND, write_behind
+
+    commits = [0]
+    with app.app_context():
+        event.listen(db.engine, "commit", lambda connection: commits.__setitem__(0, commits[0] + 1))
+
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + args.duration
+    workers = [threading.Thread(target=client_loop, args=(app, n, args.threads, args.persons, args.catalog,
+                                                          MODES[args.child][1], deadline, latencies, statuses))
+               for n in range(args.threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    loaded = time.perf_counter()
+    if WRITE_BEHIND:
+        write_behind.flush(timeout=60)
+    drained = time.perf_counter()
+
+    applied = write_behind.stats["applied"] + write_behind.stats["rejected"] if WRITE_BEHIND else len(latencies)
+    latencies.sort()
+    return {
+        "mode": args.child,
+        "threads": args.threads,
+        "requests": len(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": round(len(latencies) / (loaded - started), 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "commits": commits[0],
+        "commits_per_s": round(commits[0] / (drained - started), 1),
+        "mutations_per_commit": round(applied / max(1, commits[0]), 1),
+        "applied_per_s": round(applied / (drained - started), 1),
+        "drain_s": round(drained - loaded, 3),
+        "write_behind": write_behind.status() if WRITE_BEHIND else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persons", type=int, default=1000)
+    parser.add_argument("--catalog", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--child", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args)))
+        return
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:////tmp/bench.db")
+    # rate limiting would measure the limiter
+    env["RATE_LIMIT_PER_SECOND"] = "0"
+    for mode in args.modes:
+        subprocess.run([sys.executable, os.path.join(HERE, "seed.py"), "--persons", str(args.persons),
+                        "--catalog", str(args.catalog), "--favorites-per-person", "0"], check=True, env=env)
+        subprocess.run([sys.executable, __file__, "--child", mode, "--persons", str(args.persons),
+                        "--catalog", str(args.catalog), "--threads", str(args.threads),
+                        "--duration", str(args.duration)], check=True, env={**env, **MODES[mode][0]})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Minimal closed-loop HTTP load generator (stdlib only).
+
+    python benchmarks/loadgen.py http://127.0.0.1:3000 /characters /persons?limit=50 -c 64 -d 10
+
+Every thread keeps one keep-alive connection and fires requests back to back,
+cycling through the given paths. Prints one JSON document with throughput and
+latency percentiles.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def worker(host, port, paths, deadline, latencies, errors, offset):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    for path in itertools.islice(itertools.cycle(paths), offset, None):
+        if time.perf_counter() >= deadline:
+            break
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def run(base_url, paths, concurrency=16, duration=10.0):
+    url = urlsplit(base_url)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url.hostname, url.port or 80, paths, deadline,
+                                                     latencies, errors, n))
+               for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_url")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.base_url, args.paths, args.concurrency, args.duration)))
@@ -0,0 +1,134 @@
+"""
+Runs the benchmark suite and writes one machine-readable result file.
+
+    python benchmarks/run.py --persons 10000 --out benchmarks/results/$(git rev-parse --short HEAD).json
+    python benchmarks/run.py compare old.json new.json --threshold 0.15
+
+`compare` prints every metric that got worse by more than --threshold (latency
+and query counts up, throughput down) and exits with status 1 if there is any,
+so it can gate a release.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, HERE)
+
+# metric -> True when higher is better
+METRICS = {"rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+           "queries_per_request": False, "us_per_call": False}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    from seed import seed
+    import bench_routes
+    import bench_serializers
+    import bench_startup
+    from loadgen import run as load
+
+    seed(args.persons, args.catalog, args.favorites_per_person)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "database": os.environ["DATABASE_URL"].split("@")[-1],
+            "persons": args.persons,
+            "catalog": args.catalog,
+            "favorites_per_person": args.favorites_per_person,
+        },
+        "serializers": bench_serializers.run(min(args.persons, 1000)),
+        "routes": bench_routes.run(args.requests, args.persons, args.catalog),
+        "startup": bench_startup.run(5, reseed=False),
+    }
+    if args.http:
+        port = 8124
+        server = subprocess.Popen(["gunicorn", "wsgi", "--chdir", "./src/", "-w", str(args.workers),
+                                   "-b", f"127.0.0.1:{port}"], cwd=ROOT,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            time.sleep(3)
+            results["http"] = {
+                path: load(f"http://127.0.0.1:{port}", [path], args.concurrency, args.duration)
+                for path in ("/persons?limit=50", "/favorites?limit=100", "/characters?limit=100", "/person/1")
+            }
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key} / ")
+        elif key in METRICS:
+            yield f"{prefix}{key}", key, value
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = {name: value for name, _, value in flatten(json.load(f))}
+    regressions = 0
+    with open(new_path) as f:
+        for name, metric, value in flatten(json.load(f)):
+            before = old.get(name)
+            if not before or value is None:
+                continue
+            change = (value - before) / before
+            worse = -change if METRICS[metric] else change
+            if worse > threshold:
+                regressions += 1
+                print(json.dumps({"metric": name, "before": before, "after": value,
+                                  "change": round(change, 3)}))
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="run.py compare")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.15)
+        args = parser.parse_args(sys.argv[2:])
+        sys.exit(1 if compare(args.old, args.new, args.threshold) else 0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persons", type=int, default=1000)
+    parser.add_argument("--catalog", type=int, default=100)
+    parser.add_argument("--favorites-per-person", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="per route, test client")
+    parser.add_argument("--http", action="store_true", help="also load test a gunicorn server")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--out", help="result file, stdout when omitted")
+    args = parser.parse_args()
+
+    results = json.dumps(run_suite(args), indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(results + "\n")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Gunicorn configuration, read from the working directory by `gunicorn` (Procfile, render.yaml).
+
+    SERVER_MODE=wsgi|asgi          wsgi.py with GUNICORN_WORKER_CLASS workers, or asgi.py with uvicorn workers
+    GUNICORN_WORKER_CLASS=gthread  sync, gthread or gevent (gevent needs the 'gevent' package)
+    WEB_CONCURRENCY=4              workers, default from the CPUs available to the process
+    GUNICORN_THREADS=4             threads per gthread worker
+    GUNICORN_PRELOAD=1             import the app once in the master, workers are forked from it
+    GUNICORN_MAX_REQUESTS=10000    recycle a worker after that many requests (+ up to the jitter)
+
+Every worker opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW database connections,
+keep workers * that under the database's connection limit. The defaults come
+from benchmarks/bench_gunicorn.py.
+"""
+import os
+import sys
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+sys.path.insert(0, chdir)
+from flags import env_flag  # noqa: E402
+
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+
+def available_cpus():
+    try:
+        # the CPUs this container may use, not the ones of the host
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "wsgi"
+    worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+# a sync worker serves one request at a time and waits on the database for most of it,
+# the threaded / async ones overlap those waits and need fewer processes (and connections)
+if worker_class == "sync":
+    workers = int(os.getenv("WEB_CONCURRENCY", available_cpus() * 2 + 1))
+else:
+    workers = int(os.getenv("WEB_CONCURRENCY", available_cpus() + 1))
+# below DB_POOL_SIZE, so the threads of a worker do not queue for connections
+threads = int(os.getenv("GUNICORN_THREADS", 4)) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+
+# gevent patches the standard library when the worker starts, the app must be imported after that
+preload_app = env_flag("GUNICORN_PRELOAD", "1") and worker_class != "gevent"
+
+# bounds the memory a worker can accumulate (caches, fragmentation); a recycled worker
+# starts with cold local caches and drops its keep-alive connections, so not too often
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+if os.path.isdir("/dev/shm"):
+    # the heartbeat file, on a disk-backed /tmp it can stall workers
+    worker_tmp_dir = "/dev/shm"
+
+
+def on_starting(server):
+    if os.getenv("CACHE_REDIS_URL") == "local" and workers > 1:
+        server.log.warning("CACHE_REDIS_URL=local keeps the cache versions per worker, a write only "
+                           "invalidates the worker that made it: use a Redis URL or leave it unset")
+
+
+def post_fork(server, worker):
+    # with preload_app the engines and the cache were created in the master, a worker must
+    # not share their connections, nor the in-process cache versions, with its siblings
+    db_pool = sys.modules.get("db_pool")
+    if db_pool is not None:
+        db_pool.dispose_after_fork()
+    cache = sys.modules.get("cache")
+    if cache is not None:
+        cache.catalog_cache.reset_after_fork()
+
+
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning("psycogreen is not installed, psycopg2 queries block the gevent worker")
+        else:
+            patch_psycopg()
@@ -1,4 +1,5 @@
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -45,6 +46,18 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# created by src/search.py (create_search_indexes), not by the models: the FTS5 tables
+# of SQLite with their shadow tables, and the pg_trgm indexes of PostgreSQL
+SEARCH_INDEX_OBJECTS = re.compile(r"^\w+_fts(_(data|idx|docsize|config|content))?$|^ix_\w+_trgm$")
+
+
+def include_name(name, type_, parent_names):
+    """Keeps autogenerate (flask db migrate / check) from dropping the search indexes."""
+    if type_ in ("table", "index") and name and SEARCH_INDEX_OBJECTS.match(name):
+        return False
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +78,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -93,6 +107,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_name") is None:
+        conf_args["include_name"] = include_name
 
     connectable = get_engine()
 
@@ -0,0 +1,45 @@
+"""favorites indexes and unique favorite tuple
+
+Revision ID: 5c2e8f4a9d13
+Revises: 0b1095990fd7
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8f4a9d13'
+down_revision = '0b1095990fd7'
+branch_labels = None
+depends_on = None
+
+# MySQL 8 only takes functional key parts in parentheses
+FAVORITE_TUPLE = ['person_id',
+                  sa.text('(coalesce(character_id, 0))'),
+                  sa.text('(coalesce(planet_id, 0))'),
+                  sa.text('(coalesce(vehicle_id, 0))')]
+
+
+def upgrade():
+    # drop duplicates left by the old select-then-insert race, keeping the oldest row
+    op.execute("""
+        DELETE FROM favorites WHERE favorite_id NOT IN (
+            SELECT min_id FROM (
+                SELECT min(favorite_id) AS min_id FROM favorites
+                GROUP BY person_id, coalesce(character_id, 0), coalesce(planet_id, 0), coalesce(vehicle_id, 0)
+            ) AS keep
+        )
+    """)
+    op.create_index('uq_favorites_person_item', 'favorites', FAVORITE_TUPLE, unique=True)
+    op.create_index(op.f('ix_favorites_character_id'), 'favorites', ['character_id'], unique=False)
+    op.create_index(op.f('ix_favorites_planet_id'), 'favorites', ['planet_id'], unique=False)
+    op.create_index(op.f('ix_favorites_vehicle_id'), 'favorites', ['vehicle_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_favorites_vehicle_id'), table_name='favorites')
+    op.drop_index(op.f('ix_favorites_planet_id'), table_name='favorites')
+    op.drop_index(op.f('ix_favorites_character_id'), table_name='favorites')
+    op.drop_index('uq_favorites_person_item', table_name='favorites')
@@ -0,0 +1,30 @@
+"""person_favorites read model
+
+Revision ID: 8d4b1e6f2a57
+Revises: 5c2e8f4a9d13
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b1e6f2a57'
+down_revision = '5c2e8f4a9d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by `flask read-model rebuild`
+    op.create_table('person_favorites',
+    sa.Column('person_id', sa.Integer(), nullable=False),
+    sa.Column('favorites', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['person_id'], ['persons.person_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('person_id')
+    )
+
+
+def downgrade():
+    op.drop_table('person_favorites')
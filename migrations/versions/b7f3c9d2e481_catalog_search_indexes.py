@@ -0,0 +1,76 @@
+"""catalog search: name search indexes and filter indexes
+
+Revision ID: b7f3c9d2e481
+Revises: 8d4b1e6f2a57
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f3c9d2e481'
+down_revision = '8d4b1e6f2a57'
+branch_labels = None
+depends_on = None
+
+
+# (table, searched column, primary key), as they are at this revision
+SEARCHABLE = (
+    ('characters', 'character_name', 'character_id'),
+    ('planets', 'planet_name', 'planet_id'),
+    ('vehicles', 'vehicle_name', 'vehicle_id'),
+)
+
+
+def search_index_ddl(dialect, table, name, pk):
+    if dialect == 'postgresql':
+        return [f"CREATE INDEX IF NOT EXISTS ix_{table}_{name}_trgm ON {table} USING gin ({name} gin_trgm_ops)"]
+
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({name}, content='{table}', "
+        f"content_rowid='{pk}', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {name}) VALUES (new.{pk}, new.{name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {name}) VALUES ('delete', old.{pk}, old.{name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {name}) VALUES ('delete', old.{pk}, old.{name}); "
+        f"INSERT INTO {fts}(rowid, {name}) VALUES (new.{pk}, new.{name}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def upgrade():
+    op.create_index(op.f('ix_planets_planet_surface'), 'planets', ['planet_surface'], unique=False)
+    op.create_index(op.f('ix_vehicles_vehicle_model'), 'vehicles', ['vehicle_model'], unique=False)
+    # pg_trgm GIN indexes on PostgreSQL, FTS5 trigram tables on SQLite; skipped with a
+    # warning when the extension is not available (?q= then runs LIKE scans)
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return
+    try:
+        with connection.begin_nested():
+            if dialect == 'postgresql':
+                op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for table, name, pk in SEARCHABLE:
+                for statement in search_index_ddl(dialect, table, name, pk):
+                    op.execute(statement)
+    except Exception as e:
+        print(f"search indexes not created, ?q= falls back to LIKE scans: {e}")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, name, _ in SEARCHABLE:
+        if dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_{name}_trgm')
+        elif dialect == 'sqlite':
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
+    op.drop_index(op.f('ix_vehicles_vehicle_model'), table_name='vehicles')
+    op.drop_index(op.f('ix_planets_planet_surface'), table_name='planets')
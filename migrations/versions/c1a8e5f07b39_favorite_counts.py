@@ -0,0 +1,38 @@
+"""favorite_counts table
+
+Revision ID: c1a8e5f07b39
+Revises: b7f3c9d2e481
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1a8e5f07b39'
+down_revision = 'b7f3c9d2e481'
+branch_labels = None
+depends_on = None
+
+KINDS = {'persons': 'person_id', 'characters': 'character_id', 'planets': 'planet_id', 'vehicles': 'vehicle_id'}
+
+
+def upgrade():
+    op.create_table('favorite_counts',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'item_id')
+    )
+    op.create_index('ix_favorite_counts_top', 'favorite_counts', ['kind', sa.text('total DESC'), 'item_id'], unique=False)
+    for kind, column in KINDS.items():
+        op.execute(f"""
+            INSERT INTO favorite_counts (kind, item_id, total)
+            SELECT '{kind}', {column}, count(*) FROM favorites WHERE {column} IS NOT NULL GROUP BY {column}
+        """)
+
+
+def downgrade():
+    op.drop_index('ix_favorite_counts_top', table_name='favorite_counts')
+    op.drop_table('favorite_counts')
@@ -1,15 +1,42 @@
+"""
+Flask-Admin at /admin, built on the first request under /admin.
+
+Flask-Admin, WTForms and the admin templates take a large share of the import
+time of the app, and API workers never need them. The admin views live in their
+own Flask app, created by the LazyAdmin middleware the first time one of its
+urls is requested; the API app does not import flask_admin at all. Set
+ADMIN_ENABLED=0 to not serve /admin.
+"""
 import os
-from flask_admin import Admin
-#en la sguiente lina importamos modelos 
-from models import db, Person, Favorite, Character, Planet, Vehicle
-from flask_admin.contrib.sqla import ModelView
+import threading
+from flask import Flask
+from flags import env_flag
+from models import db
+from db_pool import register_engine
+from profiling import install_profiling
+from compression import install_compression
 
-def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
-    app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
-    admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
+ADMIN_ENABLED = env_flag("ADMIN_ENABLED", "1")
+ADMIN_PREFIX = "/admin"
+
+
+def create_admin_app(app):
+    """A Flask app serving the admin views, with the configuration (and database) of `app`."""
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+    from models import Person, Favorite, Character, Planet, Vehicle
+
+    admin_app = Flask(__name__)
+    admin_app.config.from_mapping(app.config)
+    # edits are followed by a redirect to the list, which must not come from a lagging replica
+    admin_app.config.pop('SQLALCHEMY_BINDS', None)
+    admin_app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+    admin_app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
+    db.init_app(admin_app)
+    install_profiling(admin_app)
+    install_compression(admin_app)
+    admin = Admin(admin_app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
     # Add your models here, for example this is how we add a the User model to the admin
     #migracion de modelos
     admin.add_view(ModelView(Person, db.session))
@@ -19,4 +46,36 @@ def setup_admin(app):
     admin.add_view(ModelView(Planet, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+
+    with admin_app.app_context():
+        register_engine("admin", db.engine)
+    return admin_app
+
+
+class LazyAdmin:
+    """WSGI middleware sending the requests under /admin to the admin app."""
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.admin_app = None
+        self.lock = threading.Lock()
+
+    def get_admin_app(self):
+        if self.admin_app is None:
+            with self.lock:
+                if self.admin_app is None:
+                    self.admin_app = create_admin_app(self.app)
+        return self.admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == ADMIN_PREFIX or path.startswith(ADMIN_PREFIX + "/"):
+            return self.get_admin_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+
+def setup_admin(app):
+    if ADMIN_ENABLED:
+        app.wsgi_app = LazyAdmin(app)
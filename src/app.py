@@ -2,16 +2,36 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
+import click
 from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask.cli import FlaskGroup
 from flask_cors import CORS
+from sqlalchemy.exc import IntegrityError
 from utils import APIException, generate_sitemap
 from admin import setup_admin
 from models import db, Person,Favorite,Character, Vehicle,Planet
+from pagination import page_response
+from serializers import ColumnSerializer, FavoriteSerializer
+from json_provider import json_provider_class
+from cache import cached_item, install_cache, register_invalidation
+from conditional import conditional
+from favorites import bulk_items, favorite_key, register_many, delete_many, unique_violation
+from db_pool import engine_options, register_engine, pools_status
+from profiling import install_profiling
+from compression import install_compression
+from read_model import person_serializer, register_read_model, read_model_cli
+from stats import register_counters, stats_cli, top_favorited, person_counts
+from importer import data_cli
+from ratelimit import rate_limited, admission_status
+from replicas import replica_binds, install_replicas, read_only, replicas
+from idempotency import idempotent, idempotency_cli
+from write_behind import WRITE_BEHIND, enqueue, install_write_behind, write_behind
+from catalog_snapshot import install_catalog_snapshot
+from batch import batch_requests, batch_get
 
 
 app = Flask(__name__)
+app.json = json_provider_class()(app)
 app.url_map.strict_slashes = False
 
 db_url = os.getenv("DATABASE_URL")
@@ -20,11 +40,34 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_BINDS'] = replica_binds(engine_options)
+
+click_context = click.get_current_context(silent=True)
+if click_context is not None and isinstance(click_context.find_root().command, FlaskGroup):
+    # loaded by the `flask` command: `flask db ...` needs Flask-Migrate, which imports
+    # alembic; the gunicorn / uvicorn workers (uvicorn's CLI is click too) skip both
+    from flask_migrate import Migrate
+    MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
 setup_admin(app)
+install_profiling(app)
+install_compression(app)
+# persons only for its version counter (ETag of /person/<id>), it is not cached
+register_invalidation(Character, Planet, Vehicle, Person)
+register_read_model()
+register_counters()
+app.cli.add_command(read_model_cli)
+app.cli.add_command(stats_cli)
+app.cli.add_command(data_cli)
+app.cli.add_command(idempotency_cli)
+with app.app_context():
+    register_engine("primary", db.engine)
+    install_cache(app, db.engine)
+    install_catalog_snapshot(db.engine)
+install_replicas(app, db)
+install_write_behind(app)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -36,6 +79,11 @@ def handle_invalid_usage(error):
 def sitemap():
     return generate_sitemap(app)
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({"pools": pools_status(), "replicas": replicas.status(), "admission": admission_status(),
+                    "write_behind": write_behind.status() if WRITE_BEHIND else None}),200
+
 @app.route('/user', methods=['GET'])
 def handle_hello():
 
@@ -46,6 +94,7 @@ def handle_hello():
     return jsonify(response_body), 200
 
 @app.route('/person/<int:id>',methods=['GET'])
+@conditional('persons', cache_control='private, no-cache')
 def get_person(id):
     person = Person.query.get(id)
     
@@ -59,13 +108,12 @@ def get_person(id):
 
 @app.route('/persons',methods=["GET"])
 def get_all_persons():
-    raw_list_persons = Person.query.all()
-    list_persons = [persons.serialize_with_relations()
-                      for persons in raw_list_persons]
-    return jsonify({"list_persons":list_persons})
+    return page_response("list_persons", Person, person_serializer())
 
 
 @app.route('/login/person',methods=['POST'])
+@idempotent
+@rate_limited
 def create_person():
     data_request=request.get_json()
 
@@ -106,11 +154,11 @@ def create_person():
 
 @app.route('/favorites',methods=['GET'])
 def get_all_favorites():
-    raw_list_favorities = Favorite.query.all()
-    list_favorite=[favorite.serialize() for favorite in raw_list_favorities]
-    return jsonify({'favorites': list_favorite})
+    return page_response('favorites', Favorite, FavoriteSerializer())
 
 @app.route('/favorites/register', methods=['POST'])
+@idempotent
+@rate_limited
 def register_favorities():
     data_request = request.get_json()
     
@@ -128,9 +176,9 @@ def register_favorities():
     planet_id = data_request.get("planet_id")
     vehicle_id = data_request.get("vehicle_id")
 
-    character=Character.query.get(character_id) if character_id else None
-    planet=Planet.query.get(planet_id) if planet_id else None
-    vehicle=Vehicle.query.get(vehicle_id) if vehicle_id else None
+    character=cached_item(Character, character_id) if character_id else None
+    planet=cached_item(Planet, planet_id) if planet_id else None
+    vehicle=cached_item(Vehicle, vehicle_id) if vehicle_id else None
 
     if character_id and not character:
         return jsonify({"error":"character not found"}),404
@@ -140,50 +188,58 @@ def register_favorities():
         return jsonify({"error":"vehicle not found"}),404
     
 
-    favorite_existing = Favorite.query.filter_by(
-        person_id= person.person_id,
-        character_id=character.character_id if character else None,
-        planet_id = planet.planet_id if planet else None,
-        vehicle_id= vehicle.vehicle_id if vehicle else None,
-    ).first()
+    favorite_data ={
+        "peson_id":person.person_id
+    }
 
-    if favorite_existing:
-        return jsonify({"error":f"successfully added to the user {person.name}"}),409
+    if character:
+        favorite_data["character"]={
+            "id":character["id"],
+            "name":character["name"]
+        }
+    if planet:
+        favorite_data["planet"]={
+            "id":planet["id"],
+            "name":planet["name"]
+        }
+    if vehicle:
+        favorite_data["vehicle"]={
+            "id":vehicle["id"],
+            "name":vehicle["name"]
+        }
 
+    if WRITE_BEHIND:
+        key = (person.person_id, character["id"] if character else None,
+               planet["id"] if planet else None, vehicle["id"] if vehicle else None)
+        result = enqueue("register", key)
+        if result is None:
+            return jsonify({"message":f"favorite queued for the user {person.name}",
+            "favorite":favorite_data}),202
+        if result["status"] != 200:
+            return jsonify({"error":result["error"]}),result["status"]
+        return jsonify({"message":f"favorite successfully added t o the user {person.name}",
+        "favorite":favorite_data}),200
+
+    # duplicates are rejected by the uq_favorites_person_item index, no select-then-insert race
     favorite = Favorite(
         person_id=person.person_id,
-        character_id=character.character_id if character else None,
-        planet_id=planet.planet_id if planet else None,
-        vehicle_id=vehicle.vehicle_id if vehicle else None
+        character_id=character["id"] if character else None,
+        planet_id=planet["id"] if planet else None,
+        vehicle_id=vehicle["id"] if vehicle else None
     )
 
     
     try:
         db.session.add(favorite)
         db.session.commit()
-
-        favorite_data ={
-            "peson_id":person.person_id
-        }
-
-        if character:
-            favorite_data["character"]={
-                "id":character.character_id,
-                "name":character.character_name
-            }
-        if planet:
-            favorite_data["planet"]={
-                "id":planet.planet_id,
-                "name":planet.planet_name
-            }
-        if vehicle:
-            favorite_data["vehicle"]={
-                "id":vehicle.vehicle_id,
-                "name":vehicle.vehicle_name
-            }
-
         return jsonify({"message":f"favorite successfully added t o the user {person.name}",
         "favorite":favorite_data}),200
+    except IntegrityError as e:
+        db.session.rollback()
+        if unique_violation(e):
+            return jsonify({"error":f"favorite already registered for the user {person.name}"}),409
+        # a foreign key: the person or the catalog item was deleted meanwhile
+        return jsonify({"error":"person or favorite item not found"}),404
     except Exception as e:
         db.session.rollback()
         print("Error",e)
@@ -192,6 +248,7 @@ def register_favorities():
     
 
 @app.route('/favorites', methods=['DELETE'])
+@rate_limited
 def delete_favorite():
     data_request = request.get_json()
     if not data_request or "person_id" not in data_request:
@@ -204,6 +261,18 @@ def delete_favorite():
 
     if not any([character_id,planet_id,vehicle_id]):
         return jsonify({"error": "you must indicate the ID of a character,planet or vehicle"}),400
+
+    if WRITE_BEHIND:
+        # the favorite may still be queued, whether it exists is known when the deletion is applied
+        key, error = favorite_key(data_request)
+        if error:
+            return jsonify({"error":error}),400
+        result = enqueue("delete", key)
+        if result is None:
+            return jsonify({"message": f"Favorite deletion queued for user with ID # {person_id}"}),202
+        if result["status"] != 200:
+            return jsonify({"error":result["error"]}),result["status"]
+        return jsonify({"message": f"Favorite deleted from user  with ID # {person_id}"}),200
     
     favorite = Favorite.query.filter_by(
         person_id=person_id,
@@ -225,53 +294,78 @@ def delete_favorite():
         return jsonify({"error":"Internal server error"}),500
 
 
+@app.route('/favorites/bulk', methods=['POST'])
+@idempotent
+@rate_limited
+def register_favorites_bulk():
+    items = bulk_items(request.get_json(silent=True))
+    return jsonify({"results": register_many(items)}),200
+
+@app.route('/favorites/bulk', methods=['DELETE'])
+@rate_limited
+def delete_favorites_bulk():
+    items = bulk_items(request.get_json(silent=True))
+    return jsonify({"results": delete_many(items)}),200
+
+
+
+
+@app.route('/stats/top/<kind>', methods=['GET'])
+def get_top_favorited(kind):
+    return jsonify(top_favorited(kind, request.args)),200
+
+@app.route('/stats/persons', methods=['GET'])
+def get_person_stats():
+    return jsonify(person_counts(request.args)),200
+
+
 
 
 @app.route('/characters',methods=['GET'])
+@conditional('characters', cache_control='public, max-age=60', cache_response=True)
 def get_all_character():
-    raw_list_character = Character.query.all()
-    list_character=[character.serialize() for character in raw_list_character]
-    return jsonify({'characters': list_character})
+    return page_response('characters', Character, ColumnSerializer(Character), cached=True)
 
 @app.route('/character/<int:id>',methods=['GET'])
 def get_character_id(id):
-    character = Character.query.get(id)
-    print(character)
+    character = cached_item(Character, id)
     if character:
-        return jsonify({"character":character.serialize()})
+        return jsonify({"character":character})
     else:
         return jsonify({"error": "character not found"}),404
 
 @app.route('/vehicles',methods=['GET'])
+@conditional('vehicles', cache_control='public, max-age=60', cache_response=True)
 def get_all_vehicle():
-    raw_list_vehicle = Vehicle.query.all()
-    list_vehicle=[vehicle.serialize() for vehicle in raw_list_vehicle]
-    return jsonify({'vehicles': list_vehicle})
+    return page_response('vehicles', Vehicle, ColumnSerializer(Vehicle), cached=True)
 
 @app.route('/vehicle/<int:id>',methods=['GET'])
 def get_vehicle_id(id):
-    vehicle = Vehicle.query.get(id)
-    print(vehicle)
+    vehicle = cached_item(Vehicle, id)
     if vehicle:
-        return jsonify({"vehicle":vehicle.serialize()})
+        return jsonify({"vehicle":vehicle})
     else:
         return jsonify({"error": "vehicle not found"}),404
 
 @app.route('/planets',methods=['GET'])
+@conditional('planets', cache_control='public, max-age=60', cache_response=True)
 def get_all_planet():
-    raw_list_planet = Planet.query.all()
-    list_planets=[planet.serialize() for planet in raw_list_planet]
-    return jsonify({'planets': list_planets})
+    return page_response('planets', Planet, ColumnSerializer(Planet), cached=True)
 
 @app.route('/planet/<int:id>',methods=['GET'])
 def get_planet_id(id):
-    planet = Planet.query.get(id)
-    print(planet)
+    planet = cached_item(Planet, id)
     if planet:
-        return jsonify({"planet": planet.serialize()}),200
+        return jsonify({"planet": planet}),200
     else:
         return jsonify({"error": "planet not found"}),404
 
+@app.route('/batch', methods=['POST'])
+@read_only
+def batch_lookup():
+    requests = batch_requests(request.get_json(silent=True))
+    return jsonify({"results": batch_get(requests)}),200
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,321 @@
+"""
+ASGI entry point, the async alternative to wsgi.py.
+
+The read endpoints are served by async handlers over SQLAlchemy's async engine
+(aiosqlite / asyncpg), so a slow database round-trip no longer blocks a whole
+worker. Everything else (writes, /admin, the sitemap) is delegated to the Flask
+app in a thread pool. Pagination, projection, NDJSON export, catalog cache and
+ETags behave exactly as in the sync app.
+
+    SERVER_MODE=asgi (see gunicorn.conf.py)  or  pipenv run start-asgi
+"""
+import asyncio
+import os
+from contextvars import ContextVar
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session as SyncSession
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.requests import HTTPConnection
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags
+from app import app as flask_app
+from models import db, Person, Favorite, Character, Planet, Vehicle
+from cache import catalog_cache, close_request_versions, open_request_versions, MISSING
+from catalog_snapshot import catalog_snapshot
+from compression import compressible, encode, encoded_etag, negotiate
+from db_pool import InstrumentedAsyncPool, engine_options, register_engine
+from conditional import current_etag, last_modified, not_modified, response_cache, response_key
+from pagination import ids_arg, in_order, page_args, page_serializer, select_ids, select_page, split_page
+from serializers import ColumnSerializer, FavoriteSerializer
+from read_model import person_serializer
+from search import search_filters
+from streaming import NDJSON, STREAM_BATCH_SIZE
+from utils import APIException
+from replicas import REPLICA_DATABASE_URLS, ReplicaRouting
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"no async driver configured for '{backend}' databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+database_url = flask_app.config["SQLALCHEMY_DATABASE_URI"]
+engine = create_async_engine(async_database_url(database_url),
+                             **engine_options(database_url, poolclass=InstrumentedAsyncPool))
+register_engine("async", engine.sync_engine)
+# same names as the sync replica engines of the Flask app, whose health they share
+replica_engines = {}
+for n, url in enumerate(REPLICA_DATABASE_URLS):
+    replica_engines[f"replica_{n}"] = create_async_engine(
+        async_database_url(url), **engine_options(url, poolclass=InstrumentedAsyncPool))
+    register_engine(f"async_replica_{n}", replica_engines[f"replica_{n}"].sync_engine)
+
+# (method, cookies) of the request being handled, set by ReadRequestMiddleware
+current_request = ContextVar("current_request", default=None)
+
+
+class ReplicaSession(ReplicaRouting, SyncSession):
+    """The sync side of the handlers' AsyncSessions, reads go to the replicas like in the Flask app."""
+
+    def read_request(self):
+        return current_request.get()
+
+    def replica_engine(self, name):
+        replica = replica_engines.get(name)
+        return replica.sync_engine if replica is not None else None
+
+
+Session = async_sessionmaker(engine, expire_on_commit=False, sync_session_class=ReplicaSession)
+with flask_app.app_context():
+    # for the one-off sync lookups of search.py (does the FTS table exist)
+    sync_engine = db.engine
+
+
+def json_response(data, status_code=200):
+    # the same bytes jsonify() produces, so both modes return identical bodies
+    body = flask_app.json.dumps(data, separators=(",", ":")) + "\n"
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def full_path(request):
+    # the format of Flask's request.full_path, so both modes share cache entries and ETags
+    return f"{request.url.path}?{request.url.query}"
+
+
+def wants_stream(request):
+    if request.query_params.get("stream") in ("1", "true"):
+        return True
+    return parse_accept_header(request.headers.get("accept"), MIMEAccept).best == NDJSON
+
+
+def conditional(*tables, cache_control="no-cache", cache_response=False):
+    """Async counterpart of conditional.conditional()."""
+    def decorator(handler):
+        async def wrapper(request):
+            etag = current_etag(tables, full_path(request), "ndjson" if wants_stream(request) else "json")
+            modified = last_modified(tables)
+            headers = {"Cache-Control": cache_control, "Vary": "Accept"}
+            if modified is not None:
+                headers["Last-Modified"] = http_date(modified)
+            matched = not_modified(etag, modified, parse_etags(request.headers.get("if-none-match")),
+                                   parse_date(request.headers.get("if-modified-since")))
+            if matched:
+                return Response(status_code=304, headers={**headers, "ETag": f'"{matched}"'})
+
+            encoding = negotiate(request.headers.get("accept-encoding")) if cache_response else None
+            key = response_key(etag, encoding, full_path(request))
+            stored = response_cache.get(key) if cache_response else MISSING
+            if stored is MISSING:
+                response = await handler(request)
+                if response.status_code != 200:
+                    return response
+                response.headers.update({**headers, "ETag": f'"{etag}"'})
+                if not cache_response or isinstance(response, StreamingResponse):
+                    return response
+                body, used = encode(response.body, encoding)
+                stored = (body, response.media_type, used)
+                response_cache.set(key, stored)
+
+            body, media_type, used = stored
+            headers.update({"ETag": f'"{encoded_etag(etag, used)}"', "Vary": "Accept, Accept-Encoding"})
+            if used:
+                headers["Content-Encoding"] = used
+            return Response(body, media_type=media_type, headers=headers)
+        return wrapper
+    return decorator
+
+
+async def load_versions():
+    async with engine.connect() as connection:
+        return catalog_cache.versions.from_rows(await connection.execute(catalog_cache.versions.select))
+
+
+class ReadRequestMiddleware:
+    """Records the request for the replica routing and, with the cache versions in the
+    database, loads them once without blocking the loop (the Flask app loads its own)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = None
+        if scope["type"] == "http":
+            current_request.set((scope["method"], HTTPConnection(scope).cookies))
+            if scope["method"] in ("GET", "HEAD") and catalog_cache.versions is not None:
+                token = open_request_versions(await load_versions())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if token is not None:
+                close_request_versions(token)
+
+
+class CompressionMiddleware:
+    """compression.compress_response() for the async handlers: a complete 200 body of a
+    compressible type is encoded for the request's Accept-Encoding. Streamed and already
+    encoded responses (the Flask app compresses its own) pass through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        pending = {}
+
+        async def send_encoded(message):
+            if message["type"] == "http.response.start":
+                pending["start"] = message
+                return
+            start = pending.pop("start", None)
+            if start is None:
+                return await send(message)
+
+            headers = MutableHeaders(raw=start["headers"])
+            if (start["status"] == 200 and compressible(headers.get("content-type", "").split(";")[0])
+                    and "content-encoding" not in headers):
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if not message.get("more_body"):
+                    body, used = encode(message.get("body", b""), encoding)
+                    if used:
+                        message = {**message, "body": body}
+                        headers["Content-Encoding"] = used
+                        headers["Content-Length"] = str(len(body))
+                        etag = headers.get("etag")
+                        if etag and not etag.startswith("W/"):
+                            headers["ETag"] = f'"{encoded_etag(etag.strip(chr(34)), used)}"'
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_encoded)
+
+
+async def snapshot_ready(serializer):
+    # reloading the catalog snapshot runs whole-table sync queries: in a thread, not on the loop
+    if serializer.snapshot and catalog_snapshot.stale():
+        await asyncio.to_thread(catalog_snapshot.tables)
+
+
+def stream_page(stmt, serializer):
+    dumps = flask_app.json.dumps
+
+    async def generate():
+        async with Session() as session:
+            result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for partition in result.partitions():
+                related = serializer.related_select(partition)
+                related = (await session.execute(related)).all() if related is not None else None
+                await snapshot_ready(serializer)
+                yield "".join(dumps(item) + "\n" for item in serializer.serialize_rows(partition, related))
+
+    return StreamingResponse(generate(), media_type=NDJSON)
+
+
+async def fetch_page(serializer, limit, after, where):
+    async with Session() as session:
+        result = await session.execute(select_page(serializer, after, where).limit(limit + 1))
+        rows, has_more = split_page(result.all(), limit)
+        related = serializer.related_select(rows)
+        related = (await session.execute(related)).all() if related is not None else None
+    await snapshot_ready(serializer)
+    return serializer.serialize_rows(rows, related), rows[-1]._cursor if has_more else None
+
+
+async def fetch_ids(serializer, ids, where):
+    async with Session() as session:
+        rows = (await session.execute(select_ids(serializer, ids, where))).all()
+        related = serializer.related_select(rows)
+        related = (await session.execute(related)).all() if related is not None else None
+    await snapshot_ready(serializer)
+    return in_order(ids, rows, serializer.serialize_rows(rows, related))
+
+
+def page_endpoint(key, model, serializer, cached=False):
+    async def endpoint(request):
+        limit, after, fields = page_args(model, request.query_params)
+        ids = ids_arg(request.query_params)
+        page = page_serializer(model, fields, serializer)
+        where = search_filters(model, request.query_params, sync_engine)
+        if ids is None and wants_stream(request):
+            return stream_page(select_page(page, after, where), page)
+
+        async def build():
+            if ids is not None:
+                items, missing = await fetch_ids(page, ids, where)
+                return {key: items, "missing": missing}
+            items, next_cursor = await fetch_page(page, limit, after, where)
+            return {key: items, "next": next_cursor}
+
+        if cached:
+            data = await catalog_cache.get_or_load_async(model.__tablename__, full_path(request), build)
+        else:
+            data = await build()
+        return json_response(data)
+    return endpoint
+
+
+def item_endpoint(key, model):
+    async def endpoint(request):
+        id = request.path_params["id"]
+
+        async def load():
+            async with Session() as session:
+                item = await session.get(model, id)
+                return item.serialize() if item else None
+
+        item = await catalog_cache.get_or_load_async(model.__tablename__, f"id:{id}", load)
+        if item:
+            return json_response({key: item})
+        return json_response({"error": f"{key} not found"}, 404)
+    return endpoint
+
+
+@conditional("persons", cache_control="private, no-cache")
+async def get_person(request):
+    id = request.path_params["id"]
+    async with Session() as session:
+        person = await session.get(Person, id)
+        if person:
+            return json_response({"Person": person.serialize()})
+    return json_response({"Error": f"person with {id} was not found"})
+
+
+async def handle_invalid_usage(request, error):
+    return json_response(error.to_dict(), error.status_code)
+
+
+routes = [
+    Route("/person/{id:int}", get_person, methods=["GET"]),
+    Route("/persons", page_endpoint("list_persons", Person, person_serializer()), methods=["GET"]),
+    Route("/favorites", page_endpoint("favorites", Favorite, FavoriteSerializer()), methods=["GET"]),
+    Route("/characters", conditional("characters", cache_control="public, max-age=60", cache_response=True)(
+        page_endpoint("characters", Character, ColumnSerializer(Character), cached=True)), methods=["GET"]),
+    Route("/planets", conditional("planets", cache_control="public, max-age=60", cache_response=True)(
+        page_endpoint("planets", Planet, ColumnSerializer(Planet), cached=True)), methods=["GET"]),
+    Route("/vehicles", conditional("vehicles", cache_control="public, max-age=60", cache_response=True)(
+        page_endpoint("vehicles", Vehicle, ColumnSerializer(Vehicle), cached=True)), methods=["GET"]),
+    Route("/character/{id:int}", item_endpoint("character", Character), methods=["GET"]),
+    Route("/planet/{id:int}", item_endpoint("planet", Planet), methods=["GET"]),
+    Route("/vehicle/{id:int}", item_endpoint("vehicle", Vehicle), methods=["GET"]),
+    # writes, /admin and anything not listed above
+    Mount("/", app=WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", 10)))),
+]
+
+application = Starlette(routes=routes, exception_handlers={APIException: handle_invalid_usage},
+                        middleware=[Middleware(ReadRequestMiddleware), Middleware(CompressionMiddleware)])
@@ -0,0 +1,92 @@
+"""
+POST /batch: several entity lookups in one request.
+
+    {"requests": [{"type": "character", "id": 1}, {"type": "person", "id": 7}, {"type": "character", "id": 3}]}
+
+Every type is resolved with one IN query whatever the number of its ids; the
+catalog types first through the catalog cache, whose entries they share with
+/<type>/<id>. The results come back in the order of the requests, each one like
+the matching /<type>/<id> item:
+
+    {"results": [{"index": 0, "status": 200, "character": {...}},
+                 {"index": 1, "status": 404, "error": "person not found"}, ...]}
+
+At most MULTIGET_MAX_IDS requests per batch. The route only reads, its queries go
+to the replicas like a GET's (replicas.read_only).
+"""
+from utils import APIException
+from models import Person, Character, Planet, Vehicle
+from cache import catalog_cache, MISSING
+from pagination import MULTIGET_MAX_IDS, fetch_ids
+from serializers import ColumnSerializer
+
+# type -> (model, key of the item in the /<type>/<id> response)
+TYPES = {
+    "character": (Character, "character"),
+    "planet": (Planet, "planet"),
+    "vehicle": (Vehicle, "vehicle"),
+    "person": (Person, "Person"),
+}
+# cached_item() entries, the catalog only
+CACHED = {Character, Planet, Vehicle}
+
+
+def batch_requests(data_request):
+    requests = data_request.get("requests") if isinstance(data_request, dict) else None
+    if not isinstance(requests, list) or not requests:
+        raise APIException("'requests' must be a non empty list", status_code=400)
+    if len(requests) > MULTIGET_MAX_IDS:
+        raise APIException(f"at most {MULTIGET_MAX_IDS} requests per batch", status_code=400)
+    return requests
+
+
+def parse_request(item):
+    """(type, id) of a sub-request, or an error message."""
+    if not isinstance(item, dict) or item.get("type") not in TYPES:
+        return None, f"'type' must be one of: {', '.join(TYPES)}"
+    try:
+        return (item["type"], int(item["id"])), None
+    except (KeyError, TypeError, ValueError):
+        return None, "'id' must be an integer"
+
+
+def lookup(model, ids):
+    """{id: item} of the rows of `ids` that exist."""
+    keys = {id: catalog_cache.key(model.__tablename__, f"id:{id}") for id in ids} if model in CACHED else {}
+    found, missing = {}, []
+    for id in ids:
+        item = catalog_cache.lookup(keys[id]) if keys else MISSING
+        if item is MISSING:
+            missing.append(id)
+        elif item is not None:
+            found[id] = item
+    if missing:
+        items, _ = fetch_ids(ColumnSerializer(model), missing)
+        loaded = {item["id"]: item for item in items}
+        if keys:
+            for id in missing:
+                # None too, like cached_item()
+                catalog_cache.store(keys[id], loaded.get(id))
+        found.update(loaded)
+    return found
+
+
+def batch_get(requests):
+    results = [None] * len(requests)
+    wanted = {}
+    for index, item in enumerate(requests):
+        key, error = parse_request(item)
+        if error:
+            results[index] = {"index": index, "status": 400, "error": error}
+        else:
+            wanted.setdefault(key[0], []).append((index, key[1]))
+
+    for kind, lookups in wanted.items():
+        model, key = TYPES[kind]
+        found = lookup(model, list(dict.fromkeys(id for _, id in lookups)))
+        for index, id in lookups:
+            if id in found:
+                results[index] = {"index": index, "status": 200, key: found[id]}
+            else:
+                results[index] = {"index": index, "status": 404, "error": f"{kind} not found"}
+    return results
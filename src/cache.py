@@ -0,0 +1,335 @@
+"""
+Read-through cache for the catalog (characters, planets, vehicles) and the
+per-table version counters that also drive the ETags in conditional.py.
+
+Values live in an in-process LRU with TTL and, when CACHE_REDIS_URL is set, in a
+shared backend so every gunicorn worker sees the same entries. Keys embed a
+per-table version that is bumped by SQLAlchemy model events, so any write to a
+catalog table (API, Flask-Admin or shell) invalidates its entries at once, in
+every worker: the versions live in the shared backend, or without one in the
+cache_versions table, bumped in a short transaction of their own right after the
+write commits and read once per request.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
+from models import db, CacheVersion
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 1024))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+MISSING = object()
+
+# {"tables": {name: (version, modified)}} of the request being handled, see open_request_versions()
+request_versions = ContextVar("request_versions", default=None)
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalClient:
+    """In-memory stand-in for the shared backend (the subset of the redis API we use)."""
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=100000, ttl=365 * 24 * 3600)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self._cache.get(key, None)
+        return None if value is None else str(value).encode()
+
+    def set(self, key, value, ex=None):
+        self._cache.set(key, value, ttl=ex)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._cache.get(key, 0)) + 1
+            self._cache.set(key, value)
+            return value
+
+
+def bump_statement(dialect):
+    table = CacheVersion.__table__
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(index_elements=[table.c.name],
+                                          set_={"version": table.c.version + 1, "modified": stmt.excluded.modified})
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update(version=table.c.version + 1, modified=stmt.inserted.modified)
+    raise RuntimeError(f"cache versions are not supported on '{dialect}' databases")
+
+
+def bump_rows(tables):
+    now = time.time()
+    # sorted, so concurrent bumps lock the version rows in the same order
+    return [{"name": table, "version": 1, "modified": now} for table in sorted(tables)]
+
+
+def open_request_versions(versions=None):
+    """Starts the version snapshot of a request: the first read loads all of them in
+    one query (unless `versions` are already loaded), later ones reuse it. Returns the
+    token for close_request_versions()."""
+    return request_versions.set({} if versions is None else {"tables": versions})
+
+
+def close_request_versions(token):
+    """Ends the snapshot of open_request_versions(), so the next work on the thread
+    reads the current versions."""
+    try:
+        request_versions.reset(token)
+    except ValueError:
+        # opened in another context (copied into a worker thread)
+        request_versions.set(None)
+
+
+class DatabaseVersions:
+    """Versions and write times kept in the cache_versions table of `engine`, the primary."""
+
+    select = db.select(CacheVersion.name, CacheVersion.version, CacheVersion.modified)
+
+    def __init__(self):
+        self.engine = None
+
+    @staticmethod
+    def from_rows(rows):
+        return {name: (version, modified) for name, version, modified in rows}
+
+    def load(self):
+        with self.engine.connect() as connection:
+            return self.from_rows(connection.execute(self.select))
+
+    def get(self, table):
+        """(version, modified) of `table`, (0, None) when it was never written."""
+        memo = request_versions.get()
+        if memo is None:
+            tables = self.load()
+        else:
+            if "tables" not in memo:
+                memo["tables"] = self.load()
+            tables = memo["tables"]
+        return tables.get(table, (0, None))
+
+    def forget(self):
+        memo = request_versions.get()
+        if memo is not None:
+            memo.pop("tables", None)
+
+    def bump(self, tables):
+        """Bumps `tables` in a transaction of their own."""
+        with self.engine.begin() as connection:
+            connection.execute(bump_statement(self.engine.dialect.name), bump_rows(tables))
+        self.forget()
+
+
+class CatalogCache:
+    def __init__(self, local=None, shared=None, ttl=CACHE_TTL, prefix="catalog"):
+        self.local = local if local is not None else LRUCache(ttl=ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self.prefix = prefix
+        # without a shared backend the versions are kept in the database
+        self.versions = DatabaseVersions() if shared is None else None
+        # the in-memory stand-in belongs to one process, its versions restart at 0 with
+        # every one: the epoch keeps their ETags apart
+        self.epoch = uuid.uuid4().hex[:8] if isinstance(shared, LocalClient) else "shared"
+
+    def version(self, table):
+        if self.shared is not None:
+            value = self.shared.get(f"{self.prefix}:version:{table}")
+            return int(value) if value else 0
+        return self.versions.get(table)[0]
+
+    def modified(self, table):
+        """Unix time of the last write to `table`, None when none was recorded."""
+        if self.shared is not None:
+            value = self.shared.get(f"{self.prefix}:modified:{table}")
+            return float(value) if value else None
+        return self.versions.get(table)[1]
+
+    def bump(self, table):
+        if self.shared is not None:
+            self.shared.set(f"{self.prefix}:modified:{table}", time.time())
+            return self.shared.incr(f"{self.prefix}:version:{table}")
+        self.versions.bump([table])
+
+    def reset_after_fork(self):
+        """Called in a forked worker: the in-memory stand-in and the local entries were
+        copied from the parent, the worker starts its own."""
+        if isinstance(self.shared, LocalClient):
+            self.shared = LocalClient()
+            self.epoch = uuid.uuid4().hex[:8]
+        self.local.clear()
+
+    def key(self, table, key):
+        return f"{self.prefix}:{table}:{self.version(table)}:{key}"
+
+    def lookup(self, full_key):
+        value = self.local.get(full_key)
+        if value is not MISSING:
+            return value
+        if self.shared is not None:
+            raw = self.shared.get(full_key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(full_key, value)
+                return value
+        return MISSING
+
+    def store(self, full_key, value):
+        self.local.set(full_key, value)
+        if self.shared is not None:
+            self.shared.set(full_key, json.dumps(value), ex=self.ttl)
+
+    def get_or_load(self, table, key, loader):
+        full_key = self.key(table, key)
+        value = self.lookup(full_key)
+        if value is MISSING:
+            value = loader()
+            self.store(full_key, value)
+        return value
+
+    async def get_or_load_async(self, table, key, loader):
+        """get_or_load() for the ASGI handlers, `loader` is a coroutine function."""
+        full_key = self.key(table, key)
+        value = self.lookup(full_key)
+        if value is MISSING:
+            value = await loader()
+            self.store(full_key, value)
+        return value
+
+
+def shared_client(url):
+    if url == "local":
+        return LocalClient()
+    try:
+        import redis
+    except ImportError:
+        print("CACHE_REDIS_URL is set but the 'redis' package is not installed, using the in-process cache only")
+        return None
+    return redis.Redis.from_url(url)
+
+
+catalog_cache = CatalogCache(shared=shared_client(CACHE_REDIS_URL) if CACHE_REDIS_URL else None)
+
+
+def cached_item(model, id):
+    """model.serialize() of the row with primary key `id`, or None, through the cache."""
+    def load():
+        item = db.session.get(model, id)
+        return item.serialize() if item else None
+    return catalog_cache.get_or_load(model.__tablename__, f"id:{id}", load)
+
+
+def install_cache(app, engine):
+    """Points the database versions at `engine` and gives every request of `app` its
+    own version snapshot."""
+    if catalog_cache.versions is not None:
+        catalog_cache.versions.engine = engine
+        app.before_request(open_versions)
+        app.teardown_request(close_versions)
+
+
+def open_versions():
+    g.versions_token = open_request_versions()
+
+
+def close_versions(exc):
+    # teardown, unlike after_request, also runs when the view raised
+    token = g.pop("versions_token", None)
+    if token is not None:
+        close_request_versions(token)
+
+
+def touch(session, table):
+    """Bumps `table` for writes made with Core statements that the model events below do
+    not see: when `session` commits, and with a shared backend also right now."""
+    if session is None or catalog_cache.shared is not None:
+        catalog_cache.bump(table)
+    if session is not None:
+        session.info.setdefault("touched_tables", set()).add(table)
+
+
+def register_invalidation(*models):
+    def bump(mapper, connection, target):
+        touch(object_session(target), target.__tablename__)
+
+    for model in models:
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, name, bump)
+
+
+@event.listens_for(Session, "after_commit")
+def bump_after_commit(session):
+    tables = session.info.pop("touched_tables", None)
+    if not tables:
+        return
+    if catalog_cache.versions is None:
+        # shared backend: a concurrent request may have cached the pre-commit rows under
+        # the version bumped at flush time, bump once more now that the new rows are visible
+        for table in tables:
+            catalog_cache.bump(table)
+        return
+    # database versions: not in the writing transaction, where the version row of a table
+    # would serialize all its concurrent writers until they commit. A read between the
+    # commit and the bump stores the new rows under the old version, which the bump retires
+    try:
+        catalog_cache.versions.bump(tables)
+    except SQLAlchemyError as e:
+        # the write is committed, the entries of these tables expire with CACHE_TTL
+        print("Error bumping the cache versions of", sorted(tables), e)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_touched_tables(session):
+    session.info.pop("touched_tables", None)
@@ -0,0 +1,91 @@
+"""
+Process-wide, read-only snapshot of the catalog tables (characters, planets,
+vehicles) for the favorites serializers, which only need a catalog row by id.
+
+A table is loaded whole, in one query, into a sorted array of ids and a list per
+api field, and looked up by bisection: a few dozen bytes per row where a dict of
+dicts would take hundreds. It is reloaded when the table's version in cache.py
+moves (any write to it in any worker, see register_invalidation / touch) or
+after CACHE_TTL seconds, for writes made outside of the app.
+
+Reads come from the primary, outside of the request's transaction: code that
+serializes catalog rows it changed in the same transaction (the read model
+refresh) joins the tables instead. The loads are sync queries, the ASGI handlers
+run them in a thread (asgi.snapshot_ready) rather than on the event loop.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from cache import CACHE_TTL, catalog_cache
+from models import db, Character, Planet, Vehicle
+
+
+class TableSnapshot:
+    __slots__ = ("version", "loaded_at", "fields", "ids", "columns")
+
+    def __init__(self, version, fields, rows):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.fields = fields
+        self.ids = array("q", (row[0] for row in rows))
+        self.columns = {field: [row[n] for row in rows] for n, field in enumerate(fields, start=1)}
+
+    def item(self, id, fields=None):
+        """The api fields of row `id` (all or `fields`) as a dict, None if there is no such row."""
+        index = bisect_left(self.ids, id)
+        if index == len(self.ids) or self.ids[index] != id:
+            return None
+        return {field: self.columns[field][index] for field in fields or self.fields}
+
+
+class CatalogSnapshot:
+    def __init__(self, models):
+        self.models = models
+        self.engine = None
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def fresh(self, snapshot, model):
+        return (snapshot is not None and snapshot.version == catalog_cache.version(model.__tablename__)
+                and time.monotonic() - snapshot.loaded_at < CACHE_TTL)
+
+    def table(self, model):
+        snapshot = self._tables.get(model)
+        if not self.fresh(snapshot, model):
+            with self._lock:
+                snapshot = self._tables.get(model)
+                if not self.fresh(snapshot, model):
+                    snapshot = self._tables[model] = self.load(model)
+        return snapshot
+
+    def load(self, model):
+        # the version before the rows: a write in between makes the next call reload
+        version = catalog_cache.version(model.__tablename__)
+        pk = model.__mapper__.primary_key[0]
+        columns = [getattr(model, column) for column in model.api_fields.values()]
+        with self.engine.connect() as connection:
+            rows = connection.execute(db.select(pk, *columns).order_by(pk)).all()
+        return TableSnapshot(version, tuple(model.api_fields), rows)
+
+    def stale(self):
+        """Whether tables() would reload a table."""
+        return any(not self.fresh(self._tables.get(model), model) for model in self.models)
+
+    def tables(self):
+        """{model: TableSnapshot}, up to date; take it once per page rather than per row."""
+        return {model: self.table(model) for model in self.models}
+
+    def item(self, model, id, fields=None):
+        return self.table(model).item(id, fields) if id is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+
+catalog_snapshot = CatalogSnapshot((Character, Planet, Vehicle))
+
+
+def install_catalog_snapshot(engine):
+    catalog_snapshot.engine = engine
@@ -0,0 +1,80 @@
+"""
+gzip / brotli response compression negotiated from Accept-Encoding.
+
+    COMPRESS_MIN_SIZE=1024 COMPRESS_LEVEL=6 COMPRESS_BROTLI_QUALITY=4
+
+Bodies smaller than COMPRESS_MIN_SIZE bytes are sent as they are. Brotli is only
+offered when the 'brotli' package is installed. A compressed response gets the
+encoding appended to its ETag ("<etag>-gzip"), as a strong ETag names exact bytes;
+conditional.py accepts every variant on revalidation. Streamed (NDJSON) responses
+are not compressed.
+"""
+import gzip
+import os
+from flask import request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+COMPRESS_MIMETYPES = {"application/json", "text/html", "text/plain", "text/css", "application/javascript"}
+
+# by preference, on equal quality values
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """The encoding to use for an Accept-Encoding header value, or None."""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best = max(ENCODINGS, key=accept.quality)
+    return best if accept.quality(best) > 0 else None
+
+
+def compressible(mimetype):
+    return mimetype in COMPRESS_MIMETYPES
+
+
+def encode(body, encoding):
+    """(body, encoding) to send: `body` compressed, or untouched when too small."""
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY), encoding
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0), encoding
+
+
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def apply_encoding(response, encoding):
+    """Compresses a Flask response in place with the negotiated `encoding`."""
+    if not compressible(response.mimetype):
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers):
+        return response
+    body, used = encode(response.get_data(), encoding)
+    if used:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = used
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, used), weak)
+    return response
+
+
+def compress_response(response):
+    return apply_encoding(response, negotiate(request.headers.get("Accept-Encoding")))
+
+
+def install_compression(app):
+    app.after_request(compress_response)
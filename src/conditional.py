@@ -0,0 +1,121 @@
+"""
+HTTP conditional requests for the read endpoints.
+
+The ETag is built from the per-table version counters kept in cache.py (bumped
+by model events, shared by every worker) and the request path, so a matching
+If-None-Match or If-Modified-Since is answered with 304 before the view runs:
+no row fetch and no serialization.
+
+With cache_response=True the final response bytes, already compressed for the
+negotiated encoding, are kept in response_cache under the ETag, so a repeat GET
+of an unchanged page skips the view, JSON encoding and compression altogether.
+"""
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request
+from cache import catalog_cache, LRUCache, MISSING
+from compression import ENCODINGS, apply_encoding, encoded_etag, negotiate
+from streaming import wants_stream
+
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", 256))
+
+# "<etag>:<encoding>:<full path>" -> (body, mimetype, content encoding), the ETag
+# carries the representation
+response_cache = LRUCache(maxsize=RESPONSE_CACHE_MAXSIZE)
+
+
+def current_etag(tables, full_path=None, representation=None):
+    """The ETag of the current request; `representation` is the negotiated body format,
+    "ndjson" or "json" (Accept is not part of the path, responses vary on it)."""
+    versions = ".".join(str(catalog_cache.version(table)) for table in tables)
+    path = zlib.crc32((full_path or request.full_path).encode())
+    if representation is None:
+        representation = "ndjson" if wants_stream() else "json"
+    return f"{catalog_cache.epoch}.{versions}.{path:08x}.{representation}"
+
+
+def last_modified(tables):
+    """Date of the last write to `tables`, None when no write was recorded or it happened
+    in the current second: HTTP dates have one second resolution, a later write within
+    that second would carry the same date and If-Modified-Since would miss it."""
+    stamps = [stamp for stamp in (catalog_cache.modified(table) for table in tables) if stamp is not None]
+    if not stamps or int(max(stamps)) >= int(time.time()):
+        return None
+    return datetime.fromtimestamp(int(max(stamps)), tz=timezone.utc)
+
+
+def not_modified(etag, modified, if_none_match, if_modified_since):
+    """The ETag to send back with a 304 when the client's copy is current, else None."""
+    if if_none_match:
+        # the client may hold any of the compressed variants
+        for tag in (etag, *(encoded_etag(etag, encoding) for encoding in ENCODINGS)):
+            if if_none_match.contains(tag):
+                return tag
+        return None
+    if if_modified_since and modified is not None and if_modified_since >= modified:
+        return etag
+    return None
+
+
+def response_key(etag, encoding, full_path):
+    return f"{etag}:{encoding}:{full_path}"
+
+
+def cached_response(view, args, kwargs, etag):
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    key = response_key(etag, encoding, request.full_path)
+    stored = response_cache.get(key)
+    if stored is MISSING:
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        response.set_etag(etag)
+        if response.is_streamed:
+            return response
+        apply_encoding(response, encoding)
+        response_cache.set(key, (response.get_data(), response.mimetype, response.headers.get("Content-Encoding")))
+        return response
+
+    body, mimetype, used = stored
+    response = current_app.response_class(body, mimetype=mimetype)
+    if used:
+        response.headers["Content-Encoding"] = used
+    response.vary.add("Accept-Encoding")
+    response.set_etag(encoded_etag(etag, used))
+    return response
+
+
+def conditional(*tables, cache_control="no-cache", cache_response=False):
+    """Adds ETag/Last-Modified/Cache-Control to GET responses of a view that only
+    reads `tables`, and answers revalidations with 304."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+
+            etag = current_etag(tables)
+            modified = last_modified(tables)
+            matched = not_modified(etag, modified, request.if_none_match, request.if_modified_since)
+            if matched:
+                response = make_response("", 304)
+                response.set_etag(matched)
+            elif cache_response:
+                response = cached_response(view, args, kwargs, etag)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            if response.status_code not in (200, 304):
+                return response
+            response.vary.add("Accept")
+            if modified is not None:
+                response.last_modified = modified
+            response.headers["Cache-Control"] = cache_control
+            return response
+        return wrapper
+    return decorator
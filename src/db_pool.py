@@ -0,0 +1,157 @@
+"""
+Connection pool configuration (env driven) and pool instrumentation.
+
+    DB_POOL_SIZE=5 DB_MAX_OVERFLOW=10 DB_POOL_TIMEOUT=30 DB_POOL_RECYCLE=1800 DB_POOL_PRE_PING=1
+
+The pools record how long callers waited for a connection, so GET /metrics can
+show checked-out, overflow and wait-time numbers to size the pool from.
+"""
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from flags import env_flag
+
+
+class PoolStats:
+    def __init__(self, recent=1000):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # (time.monotonic() of the checkout, wait)
+        self.recent_waits = deque(maxlen=recent)
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.recent_waits.append((time.monotonic(), seconds))
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(wait for _, wait in self.recent_waits)
+            calls = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / calls * 1000, 3) if calls else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                # over the last `recent` checkouts
+                "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 3) if waits else 0.0,
+                "wait_p99_ms": round(waits[int(len(waits) * 0.99)] * 1000, 3) if waits else 0.0,
+            }
+
+    def recent_wait(self, window, pct=95):
+        """pct-th percentile of the waits of the last `window` seconds, 0 without checkouts."""
+        since = time.monotonic() - window
+        with self._lock:
+            waits = sorted(wait for at, wait in self.recent_waits if at >= since)
+        return waits[int(len(waits) * pct / 100)] if waits else 0.0
+
+
+class InstrumentedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        if kwargs.get("_dispatch") is None:
+            # recreate() hands the listeners of the old pool over through _dispatch
+            event.listen(self, "connect", lambda *a: self.stats.count("connects"))
+            event.listen(self, "invalidate", lambda *a: self.stats.count("invalidations"))
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool, keep the counters
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(database_url, poolclass=InstrumentedQueuePool):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url`."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # in-memory SQLite keeps its single connection pool
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "1"),
+    }
+
+
+ENGINES = {}
+
+
+def register_engine(name, engine):
+    """Makes `engine` show up in GET /metrics."""
+    ENGINES[name] = engine
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+
+def recent_pool_wait(window, pct=95):
+    """The largest recent_wait() of the registered engines' pools, in seconds."""
+    stats = [getattr(engine.pool, "stats", None) for engine in ENGINES.values()]
+    return max((s.recent_wait(window, pct) for s in stats if s is not None), default=0.0)
+
+
+def pools_status():
+    return {name: pool_status(engine) for name, engine in ENGINES.items()}
+
+
+def dispose_after_fork():
+    """Called in a forked worker: gives every engine a new, empty pool. The connections
+    inherited from the parent are dropped without being closed, the parent still owns them."""
+    for engine in ENGINES.values():
+        engine.dispose(close=False)
@@ -0,0 +1,230 @@
+"""
+Bulk registration and deletion of favorites.
+
+Whatever the size of the batch this costs one IN query per referenced table, one
+query for the existing favorites of the persons involved and one executemany in
+a single transaction. Every item gets its own entry in the result array.
+"""
+import os
+from utils import APIException
+from models import db, Person, Favorite, Character, Planet, Vehicle
+from read_model import READ_MODEL, refresh_persons
+from stats import apply_counts, favorite_deltas
+
+BULK_MAX_ITEMS = int(os.getenv("FAVORITES_BULK_MAX_ITEMS", 500))
+
+CATALOG = (
+    ("character_id", Character),
+    ("planet_id", Planet),
+    ("vehicle_id", Vehicle),
+)
+FIELDS = ("person_id", "character_id", "planet_id", "vehicle_id")
+COLUMNS = [getattr(Favorite, field) for field in FIELDS]
+
+
+def bulk_items(data_request):
+    items = data_request.get("favorites") if isinstance(data_request, dict) else None
+    if not isinstance(items, list) or not items:
+        raise APIException("'favorites' must be a non empty list", status_code=400)
+    if len(items) > BULK_MAX_ITEMS:
+        raise APIException(f"at most {BULK_MAX_ITEMS} favorites per request", status_code=400)
+    return items
+
+
+def favorite_key(item):
+    """(person_id, character_id, planet_id, vehicle_id) of a request item, or an error message."""
+    if not isinstance(item, dict) or "person_id" not in item:
+        return None, "the 'person_id' field is mandatory"
+    if not any(item.get(field) for field, _ in CATALOG):
+        return None, "one of these fields is required:character_id,planet_id,vehicle_id"
+    try:
+        return tuple(int(item[f]) if item.get(f) else None for f in FIELDS), None
+    except (TypeError, ValueError):
+        return None, "ids must be integers"
+
+
+def parse_items(items):
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        key, error = favorite_key(item)
+        if error:
+            results[index] = result(index, 400, error=error)
+        else:
+            valid.append((index, key))
+    return results, valid
+
+
+def existing_ids(model, ids):
+    if not ids:
+        return set()
+    pk = model.__mapper__.primary_key[0]
+    return set(db.session.scalars(db.select(pk).where(pk.in_(ids))))
+
+
+def favorites_of(person_ids):
+    """{(person_id, character_id, planet_id, vehicle_id): favorite_id} for these persons."""
+    if not person_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(Favorite.favorite_id, Favorite.person_id, Favorite.character_id,
+                  Favorite.planet_id, Favorite.vehicle_id)
+        .where(Favorite.person_id.in_(person_ids))
+    )
+    return {(row.person_id, row.character_id, row.planet_id, row.vehicle_id): row.favorite_id
+            for row in rows}
+
+
+def insert_ignoring_duplicates(model):
+    # a concurrent request may insert the same favorite between our check and our insert,
+    # let the unique index drop it instead of failing the whole batch
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect == "mysql":
+        return db.insert(model).prefix_with("IGNORE")
+    return db.insert(model)
+
+
+def unique_violation(error):
+    """Whether an IntegrityError was raised by a unique index (a duplicate), rather than by
+    a foreign key (a person or catalog row deleted meanwhile) or a NOT NULL column."""
+    orig = error.orig
+    # SQLSTATE on PostgreSQL, the extended result code on SQLite, ER_DUP_ENTRY on MySQL
+    if getattr(orig, "pgcode", None):
+        return orig.pgcode == "23505"
+    if getattr(orig, "sqlite_errorname", None):
+        return orig.sqlite_errorname in ("SQLITE_CONSTRAINT_UNIQUE", "SQLITE_CONSTRAINT_PRIMARYKEY")
+    if orig.args and isinstance(orig.args[0], int):
+        return orig.args[0] == 1062
+    return "unique" in str(orig).lower()
+
+
+def result(index, status, **extra):
+    return {"index": index, "status": status, **extra}
+
+
+def found_references(keys):
+    """{field: ids that exist} of the persons and catalog rows referenced by `keys`."""
+    found = {"person_id": existing_ids(Person, {key[0] for key in keys})}
+    for position, (field, model) in enumerate(CATALOG, start=1):
+        found[field] = existing_ids(model, {key[position] for key in keys if key[position]})
+    return found
+
+
+def reference_error(item, found):
+    if item["person_id"] not in found["person_id"]:
+        return "person not found in the database"
+    missing = [field for field, _ in CATALOG if item[field] and item[field] not in found[field]]
+    if missing:
+        return f"{missing[0].replace('_id', '')} not found"
+    return None
+
+
+def insert_rows(rows):
+    """Inserts favorites in the session's transaction, with their counters and read model.
+    Returns the keys of the rows written: a row a concurrent request inserted first is
+    dropped by the unique index (only where the dialect tells, MySQL reports them all)."""
+    stmt = insert_ignoring_duplicates(Favorite)
+    if db.session.get_bind().dialect.insert_executemany_returning:
+        # rows dropped by the unique index are not returned, so they are not counted
+        written = db.session.execute(stmt.returning(*COLUMNS), rows).mappings().all()
+    else:
+        db.session.execute(stmt, rows)
+        written = rows
+    # Core statements do not fire the model events stats.py and read_model.py listen to
+    apply_counts(db.session, favorite_deltas(written))
+    if READ_MODEL:
+        refresh_persons(db.session, {row["person_id"] for row in rows})
+    return {tuple(row[field] for field in FIELDS) for row in written}
+
+
+def register_many(items):
+    results, valid = parse_items(items)
+
+    found = found_references([key for _, key in valid])
+    existing = favorites_of(found["person_id"])
+
+    # key -> index of the item inserting it
+    pending = {}
+    for index, key in valid:
+        item = dict(zip(FIELDS, key))
+        error = reference_error(item, found)
+        if error:
+            results[index] = result(index, 404, error=error)
+            continue
+        if key in existing or key in pending:
+            results[index] = result(index, 409, error="favorite already registered")
+            continue
+        pending[key] = index
+        results[index] = result(index, 200, favorite=item)
+
+    if pending:
+        try:
+            written = insert_rows([dict(zip(FIELDS, key)) for key in pending])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print("Error", e)
+            raise APIException("Sorry, there was a server error", status_code=500)
+        for key, index in pending.items():
+            if key not in written:
+                results[index] = result(index, 409, error="favorite already registered")
+    return results
+
+
+def delete_rows(to_delete):
+    """Deletes favorites ({favorite_id: columns}) in the session's transaction, with their
+    counters and read model. Returns the ids of the rows deleted: a concurrent request may
+    have deleted some of them first."""
+    stmt = db.delete(Favorite).where(Favorite.favorite_id.in_(to_delete))
+    if db.session.get_bind().dialect.delete_returning:
+        deleted = db.session.execute(stmt.returning(Favorite.favorite_id)).scalars().all()
+    else:
+        # MySQL: lock the rows still there, the DELETE then removes exactly those
+        deleted = db.session.scalars(
+            db.select(Favorite.favorite_id)
+            .where(Favorite.favorite_id.in_(to_delete))
+            .with_for_update()
+        ).all()
+        if deleted:
+            db.session.execute(db.delete(Favorite).where(Favorite.favorite_id.in_(deleted)))
+    rows = [to_delete[favorite_id] for favorite_id in deleted]
+    apply_counts(db.session, favorite_deltas(rows, -1))
+    if READ_MODEL:
+        refresh_persons(db.session, {row["person_id"] for row in to_delete.values()})
+    return set(deleted)
+
+
+def delete_many(items):
+    results, valid = parse_items(items)
+
+    existing = favorites_of({key[0] for _, key in valid})
+    to_delete = {}
+    # favorite_id -> index of the item deleting it
+    pending = {}
+    for index, key in valid:
+        favorite_id = existing.get(key)
+        if favorite_id is None or favorite_id in to_delete:
+            results[index] = result(index, 404, error="Favorite not found with ID provided")
+            continue
+        to_delete[favorite_id] = dict(zip(FIELDS, key))
+        pending[favorite_id] = index
+        results[index] = result(index, 200, favorite_id=favorite_id)
+
+    if to_delete:
+        try:
+            deleted = delete_rows(to_delete)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print("Error al eliminar los favoritos:", e)
+            raise APIException("Internal server error", status_code=500)
+        for favorite_id, index in pending.items():
+            if favorite_id not in deleted:
+                results[index] = result(index, 404, error="Favorite not found with ID provided")
+    return results
@@ -0,0 +1,10 @@
+"""
+On/off settings from the environment. Imports nothing but os, so gunicorn.conf.py
+can use it in the master before the workers are forked (and gevent patched).
+"""
+import os
+
+
+def env_flag(name, default):
+    """Whether the variable `name` (or `default` when unset) is 1, true, yes or on."""
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,138 @@
+"""
+Idempotency-Key support for the create endpoints.
+
+    POST /favorites/register
+    Idempotency-Key: 6f1c2b0e-...
+
+The first request with a key claims it (a row of idempotency_keys, inserted in
+its own transaction, so of concurrent duplicates exactly one runs) and its 2xx
+response is stored for IDEMPOTENCY_TTL seconds. Retries with the same key and
+body get the stored response back, with an Idempotent-Replayed header, after one
+primary key lookup and without touching the domain tables. While the first
+request runs a duplicate gets a 409, the same key with another body a 422. Error
+responses are not stored: the key is released and the request can be retried.
+A claim left by a crashed worker expires after IDEMPOTENCY_LOCK_SECONDS.
+
+`flask idempotency purge` deletes the expired keys.
+"""
+import hashlib
+import json
+import os
+import time
+from functools import wraps
+import click
+from flask import jsonify, make_response, request
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))
+
+HEADER = "Idempotency-Key"
+table = IdempotencyKey.__table__
+
+
+def request_hash():
+    data = request.get_json(silent=True)
+    # the same JSON with its keys in another order is the same request
+    raw = request.get_data() if data is None else json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def key_filter(route, key):
+    return (table.c.route == route) & (table.c.key == key)
+
+
+def lookup(route, key):
+    # the primary's engine, not db.session: the key must be seen by every worker at once
+    with db.engine.connect() as connection:
+        return connection.execute(
+            db.select(table).where(key_filter(route, key), table.c.expires_at > time.time())).first()
+
+
+def claim(route, key, digest):
+    """Inserts the in-progress row of `key`, False when a concurrent duplicate did first."""
+    now = time.time()
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(db.delete(table).where(key_filter(route, key), table.c.expires_at <= now))
+            connection.execute(db.insert(table).values(route=route, key=key, request_hash=digest,
+                                                       expires_at=now + IDEMPOTENCY_LOCK_SECONDS))
+        return True
+    except IntegrityError:
+        return False
+
+
+def store(route, key, response):
+    with db.engine.begin() as connection:
+        connection.execute(db.update(table).where(key_filter(route, key)).values(
+            status_code=response.status_code, content_type=response.content_type,
+            body=response.get_data(), expires_at=time.time() + IDEMPOTENCY_TTL))
+
+
+def release(route, key):
+    with db.engine.begin() as connection:
+        connection.execute(db.delete(table).where(key_filter(route, key)))
+
+
+def in_progress():
+    response = jsonify({"error": f"a request with this {HEADER} is in progress"})
+    response.status_code = 409
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def replay(row, digest):
+    if row.request_hash != digest:
+        return jsonify({"error": f"this {HEADER} was already used with a different request"}), 422
+    if row.status_code is None:
+        return in_progress()
+    response = make_response(row.body, row.status_code)
+    response.content_type = row.content_type
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    """Runs `view` once per Idempotency-Key, see the module docstring."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > table.c.key.type.length:
+            return jsonify({"error": f"the {HEADER} header must have 1 to {table.c.key.type.length} characters"}), 400
+
+        route, digest = request.endpoint, request_hash()
+        row = lookup(route, key)
+        if row is None and not claim(route, key, digest):
+            row = lookup(route, key)
+            if row is None:
+                # the other request failed and released the key in between, retry
+                return in_progress()
+        if row is not None:
+            return replay(row, digest)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            release(route, key)
+            raise
+        if 200 <= response.status_code < 300 and not response.is_streamed:
+            store(route, key, response)
+        else:
+            release(route, key)
+        return response
+    return wrapper
+
+
+idempotency_cli = AppGroup("idempotency", help="Maintain the idempotency_keys table.")
+
+
+@idempotency_cli.command("purge")
+def purge():
+    """Deletes the expired idempotency keys."""
+    with db.engine.begin() as connection:
+        deleted = connection.execute(db.delete(table).where(table.c.expires_at <= time.time())).rowcount
+    click.echo(f"{deleted} expired idempotency keys deleted")
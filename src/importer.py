@@ -0,0 +1,189 @@
+"""
+Bulk import of catalog and person rows from CSV or NDJSON files.
+
+    flask data import characters characters.csv
+    flask data import planets planets.ndjson --batch-size 20000
+
+Fields are the API names (id, name, ...) or the column names. Rows are upserted
+on the primary key: existing rows are updated, new ones inserted. The file is
+streamed and written in batches of one transaction each, so memory stays flat
+whatever its size. On PostgreSQL (psycopg2) every batch is loaded with COPY into
+a temporary table and upserted from there, other databases get an executemany
+INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE.
+"""
+import csv
+import io
+import json
+import os
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Person, Character, Planet, Vehicle
+from cache import touch
+from read_model import READ_MODEL, rebuild_read_model
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 10000))
+
+TABLES = {"characters": Character, "planets": Planet, "vehicles": Vehicle, "persons": Person}
+
+
+def field_columns(model):
+    """{field name accepted in the file: column}"""
+    columns = {column.key: column for column in model.__table__.columns}
+    fields = {name: columns[key] for name, key in model.api_fields.items()}
+    fields.update(columns)
+    return fields
+
+
+def read_records(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def converted(records, model):
+    """Records as {column: value} dicts, typed like the columns; '' is NULL."""
+    fields = field_columns(model)
+    pk = [column.key for column in model.__table__.primary_key]
+    keys = None
+    for number, record in enumerate(records, start=1):
+        row = {}
+        for name, value in record.items():
+            column = fields.get(name)
+            if column is None:
+                raise click.ClickException(f"record {number}: unknown field '{name}'")
+            if value == "":
+                value = None
+            elif isinstance(value, str) and column.type.python_type is not str:
+                try:
+                    value = column.type.python_type(value)
+                except ValueError:
+                    raise click.ClickException(f"record {number}: '{name}' must be of type {column.type.python_type.__name__}")
+            row[column.key] = value
+        if keys is None:
+            keys = set(row)
+            missing = [key for key in pk if key not in keys]
+            if missing:
+                raise click.ClickException(f"the primary key field is missing: {missing[0]}")
+        elif set(row) != keys:
+            # every batch is one statement, all the rows need the same columns
+            raise click.ClickException(f"record {number}: fields differ from the first record")
+        yield row
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_statement(table, columns, dialect):
+    pk = [column.name for column in table.primary_key]
+    updates = [column for column in columns if column not in pk]
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        if not updates:
+            return stmt.on_conflict_do_nothing(index_elements=pk)
+        return stmt.on_conflict_do_update(index_elements=pk, set_={c: stmt.excluded[c] for c in updates})
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in updates or pk})
+    raise click.ClickException(f"imports are not supported on '{dialect}' databases")
+
+
+def copy_supported(connection):
+    return connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2"
+
+
+def copy_batch(connection, table, columns, rows):
+    """COPY `rows` into a temporary table, then upsert them into `table` with one statement."""
+    staging = f"import_{table.name}"
+    pk_columns = [column.name for column in table.primary_key]
+    pk = ", ".join(pk_columns)
+    names = ", ".join(columns)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in pk_columns)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row[c] for c in columns)
+    buffer.seek(0)
+
+    connection.execute(text(f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+                            f"(LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"))
+    with connection.connection.driver_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {staging} ({names}) FROM STDIN WITH (FORMAT csv)", buffer)
+    # DISTINCT ON: an upsert cannot touch the same row twice, the last line of the file wins
+    connection.execute(text(
+        f"INSERT INTO {table.name} ({names}) "
+        f"SELECT DISTINCT ON ({pk}) {names} FROM {staging} ORDER BY {pk}, ctid DESC "
+        f"ON CONFLICT ({pk}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+    ))
+
+
+def import_rows(session, model, records, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Upserts `records` (dicts keyed by field name) into the table of `model`, committing
+    every `batch_size` rows. Returns the number of rows written."""
+    table = model.__table__
+    count = 0
+    started = time.perf_counter()
+    for batch in batches(converted(records, model), batch_size):
+        connection = session.connection()
+        columns = list(batch[0])
+        try:
+            if copy_supported(connection):
+                copy_batch(connection, table, columns, batch)
+            else:
+                session.execute(upsert_statement(table, columns, connection.dialect.name), batch)
+            # Core writes do not fire the model events the catalog cache listens to
+            touch(session, table.name)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            raise click.ClickException(f"rows {count + 1}-{count + len(batch)} rejected, "
+                                       f"the {count} rows before them are imported: {getattr(e, 'orig', e)}")
+        count += len(batch)
+        if progress:
+            progress(count, time.perf_counter() - started)
+    return count
+
+
+data_cli = AppGroup("data", help="Import catalog and person data.")
+
+
+@data_cli.command("import")
+@click.argument("table", type=click.Choice(list(TABLES)))
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]),
+              help="Defaults to the file extension (.csv, anything else is NDJSON).")
+@click.option("--batch-size", type=int, default=IMPORT_BATCH_SIZE, show_default=True)
+def import_file(table, file, fmt, batch_size):
+    """Upserts the rows of FILE (CSV or NDJSON, '-' for stdin) into TABLE."""
+    if fmt is None:
+        fmt = "csv" if file.name.endswith(".csv") else "ndjson"
+
+    def progress(count, elapsed):
+        click.echo(f"{table}: {count} rows, {count / elapsed:.0f} rows/s", err=True)
+
+    count = import_rows(db.session, TABLES[table], read_records(file, fmt), batch_size, progress)
+    if READ_MODEL and count:
+        # the favorites lists embed catalog and person rows
+        rebuild_read_model(db.session)
+        db.session.commit()
+        click.echo("person_favorites rebuilt", err=True)
+    click.echo(f"imported {count} rows into {table}")
@@ -0,0 +1,38 @@
+"""
+orjson backed JSON provider for the Flask app, with the stdlib provider as fallback
+when orjson is not installed. Output is the same as jsonify's (compact, sorted keys).
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def options(self):
+        # dates go through self.default so they keep Flask's HTTP date format
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is always compact, formatting kwargs (separators...) do not apply
+        option = self.options()
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options())
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def json_provider_class():
+    return OrjsonProvider if orjson is not None else DefaultJSONProvider
@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
-from typing import List
-from sqlalchemy import String,  Integer,ForeignKey
+from typing import List, Optional
+from sqlalchemy import String,  Integer,ForeignKey, Index, JSON, Float, LargeBinary, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Person(db.Model):
     __tablename__="persons"
@@ -15,6 +16,8 @@ class Person(db.Model):
     favorites:Mapped[List["Favorite"]]=relationship("Favorite",
     back_populates="person"
 )
+    # public field name -> column, used by ?fields= projections
+    api_fields={'id':'person_id','nickname':'nickname','name':'name','last_name':'last_name'}
     
 
     def serialize(self):
@@ -38,50 +41,58 @@ class Favorite(db.Model):
     person:Mapped['Person']=relationship("Person",
         back_populates="favorites"
     )
-    character_id:Mapped[int]=mapped_column(ForeignKey('characters.character_id'),nullable=True)
+    character_id:Mapped[int]=mapped_column(ForeignKey('characters.character_id'),nullable=True,index=True)
     characters:Mapped["Character"]=relationship(
         back_populates="favorites"
     )
-    planet_id:Mapped[int]=mapped_column(ForeignKey('planets.planet_id'),nullable=True)
+    planet_id:Mapped[int]=mapped_column(ForeignKey('planets.planet_id'),nullable=True,index=True)
     planets:Mapped["Planet"]=relationship(
         back_populates="favorites"
     )
-    vehicle_id:Mapped[int]=mapped_column(ForeignKey('vehicles.vehicle_id'),nullable=True)
+    vehicle_id:Mapped[int]=mapped_column(ForeignKey('vehicles.vehicle_id'),nullable=True,index=True)
     vehicles:Mapped["Vehicle"]=relationship(
         back_populates="favorites"
     )
+    api_fields={'id':'favorite_id','person_id':'person_id','character_id':'character_id',
+                'planet_id':'planet_id','vehicle_id':'vehicle_id'}
 
     def serialize(self):
+        # names from the catalog snapshot, without loading the related instances
+        from catalog_snapshot import catalog_snapshot
 
         data ={
             "person_id":self.person_id
         }
 
-        if self.characters:
-            data["characters"]={
-                "id": self.characters.character_id,
-                "name":self.characters.character_name
-            }
-        if self.planets:
-            data["planet"]={
-                "id": self.planets.planet_id,
-                "name":self.planets.planet_name
-            }
-        if self.vehicles:
-            data["vehicle"]={
-                "id": self.vehicles.vehicle_id,
-                "name":self.vehicles.vehicle_name
-            }
+        character = catalog_snapshot.item(Character, self.character_id, ("id", "name"))
+        if character:
+            data["characters"]=character
+        planet = catalog_snapshot.item(Planet, self.planet_id, ("id", "name"))
+        if planet:
+            data["planet"]=planet
+        vehicle = catalog_snapshot.item(Vehicle, self.vehicle_id, ("id", "name"))
+        if vehicle:
+            data["vehicle"]=vehicle
         return data
     
     def serialize_with_relations(self):
+        from catalog_snapshot import catalog_snapshot
         data=self.serialize()
         data["person"]= self.person.serialize() if self.person else None
-        data["character"]= self.characters.serialize() if self.characters else None
-        data["vehicles"]= self.vehicles.serialize()if self.vehicles else None
-        data["planets"]= self.planets.serialize()if self.planets else None
+        data["character"]= catalog_snapshot.item(Character, self.character_id)
+        data["vehicles"]= catalog_snapshot.item(Vehicle, self.vehicle_id)
+        data["planets"]= catalog_snapshot.item(Planet, self.planet_id)
         return data
-    
+
+# one row per (person, character, planet, vehicle). NULLs never collide in a unique index,
+# so the nullable ids are coalesced to 0; person_id leads, so it also serves lookups by person
+Index("uq_favorites_person_item",
+    Favorite.person_id,
+    func.coalesce(Favorite.character_id, 0),
+    func.coalesce(Favorite.planet_id, 0),
+    func.coalesce(Favorite.vehicle_id, 0),
+    unique=True,
+)
 
 
 class Character(db.Model):
@@ -92,6 +103,9 @@ class Character(db.Model):
     favorites:Mapped[List["Favorite"]]=relationship(
         back_populates="characters"
     )
+    api_fields={'id':'character_id','name':'character_name','birthday':'birthday_character'}
+    # ?q= searches this field, see search.py
+    api_search='name'
     def serialize(self):
         return{
             'id':self.character_id,
@@ -109,10 +123,14 @@ class Planet(db.Model):
     __tablename__="planets"
     planet_id:Mapped[int]=mapped_column(Integer,primary_key=True)
     planet_name:Mapped[str]=mapped_column(String(250))
-    planet_surface:Mapped[int]=mapped_column(Integer)
+    planet_surface:Mapped[int]=mapped_column(Integer,index=True)
     favorites:Mapped[List["Favorite"]]=relationship(
         back_populates="planets"
     )
+    api_fields={'id':'planet_id','name':'planet_name','surfice':'planet_surface'}
+    api_search='name'
+    # ?surfice=, ?surfice_min=, ?surfice_max=
+    api_filters={'surfice':'range'}
     def serialize(self):
         return{
             'id':self.planet_id,
@@ -130,10 +148,13 @@ class Vehicle(db.Model):
     __tablename__="vehicles"
     vehicle_id:Mapped[int]=mapped_column(Integer,primary_key=True)
     vehicle_name:Mapped[str]=mapped_column(String(250))
-    vehicle_model:Mapped[int]=mapped_column(String(250))
+    vehicle_model:Mapped[int]=mapped_column(String(250),index=True)
     favorites:Mapped[List["Favorite"]]=relationship(
         back_populates="vehicles"
     )
+    api_fields={'id':'vehicle_id','name':'vehicle_name','model':'vehicle_model'}
+    api_search='name'
+    api_filters={'model':'eq'}
     def serialize(self):
         return{
             'id':self.vehicle_id,
@@ -146,3 +167,46 @@ class Vehicle(db.Model):
         data['favorites'] = [favorite.serialize() for favorite in self.favorites]
         return data
 
+
+
+class PersonFavorites(db.Model):
+    # read model of /persons: a person's favorites as Person.serialize_with_relations() lists
+    # them, kept up to date by read_model.py. No row means no favorites
+    __tablename__="person_favorites"
+    person_id:Mapped[int]=mapped_column(ForeignKey('persons.person_id',ondelete='CASCADE'),primary_key=True)
+    favorites:Mapped[list]=mapped_column(JSON,nullable=False)
+
+
+class FavoriteCount(db.Model):
+    # favorites per person / character / planet / vehicle (kind = table name), kept up to
+    # date by stats.py so the stats endpoints never scan favorites
+    __tablename__="favorite_counts"
+    kind:Mapped[str]=mapped_column(String(20),primary_key=True)
+    item_id:Mapped[int]=mapped_column(Integer,primary_key=True)
+    total:Mapped[int]=mapped_column(Integer,nullable=False,default=0)
+
+# top N of a kind is a range scan of this index
+Index("ix_favorite_counts_top", FavoriteCount.kind, FavoriteCount.total.desc(), FavoriteCount.item_id)
+
+
+class IdempotencyKey(db.Model):
+    # first successful response of a write sent with an Idempotency-Key header, replayed by
+    # idempotency.py on retries. status_code is NULL while the first request runs
+    __tablename__="idempotency_keys"
+    route:Mapped[str]=mapped_column(String(64),primary_key=True)
+    key:Mapped[str]=mapped_column(String(255),primary_key=True)
+    request_hash:Mapped[str]=mapped_column(String(64),nullable=False)
+    status_code:Mapped[Optional[int]]=mapped_column(Integer)
+    content_type:Mapped[Optional[str]]=mapped_column(String(100))
+    body:Mapped[Optional[bytes]]=mapped_column(LargeBinary)
+    # unix time
+    expires_at:Mapped[float]=mapped_column(Float,nullable=False,index=True)
+
+
+class CacheVersion(db.Model):
+    # version and unix time of the last write of a table (name), bumped by cache.py right
+    # after the write commits; the catalog cache keys and the ETags are built from them
+    __tablename__="cache_versions"
+    name:Mapped[str]=mapped_column(String(40),primary_key=True)
+    version:Mapped[int]=mapped_column(Integer,nullable=False,default=0)
+    modified:Mapped[float]=mapped_column(Float,nullable=False)
@@ -0,0 +1,143 @@
+"""
+Keyset (cursor) pagination and ?fields= projection shared by the collection endpoints.
+
+    GET /characters?limit=50&after=120&fields=id,name
+
+`after` is the last id of the previous page (the `next` value of the previous
+response), so every page is a `WHERE id > :after ORDER BY id LIMIT :limit`
+index range scan, no matter how deep the client pages. ?q= and the typed filters
+of search.py add their conditions to the same statement. Rows are turned into
+dicts by the column serializers in serializers.py. With ?stream=1 the whole
+collection is sent as NDJSON instead (see streaming.py).
+
+    GET /characters?ids=4,1,9
+
+returns those rows, in that order, with one IN query (plus the serializer's
+related query) and lists the ids that do not exist under "missing".
+"""
+import os
+from flask import jsonify, request
+from utils import APIException
+from models import db
+from streaming import stream_rows, wants_stream
+from cache import catalog_cache
+from serializers import ColumnSerializer
+from search import search_filters
+
+DEFAULT_LIMIT = int(os.getenv("API_PAGE_LIMIT", 100))
+MAX_LIMIT = int(os.getenv("API_PAGE_MAX_LIMIT", 1000))
+MULTIGET_MAX_IDS = int(os.getenv("MULTIGET_MAX_IDS", 100))
+
+
+def page_args(model, args=None):
+    """(limit, after, fields) from the query string, `args` defaults to Flask's request.args."""
+    if args is None:
+        args = request.args
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        after = args.get("after")
+        after = int(after) if after else None
+    except ValueError:
+        raise APIException("'limit' and 'after' must be integers", status_code=400)
+    if limit < 1:
+        raise APIException("'limit' must be greater than 0", status_code=400)
+
+    fields = args.get("fields")
+    if fields:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in fields if f not in model.api_fields]
+        if unknown:
+            raise APIException(f"unknown fields: {', '.join(unknown)}", status_code=400,
+                               payload={"allowed_fields": list(model.api_fields)})
+    return min(limit, MAX_LIMIT), after, fields or None
+
+
+def ids_arg(args=None):
+    """The ids of ?ids=, without duplicates, in the order given; None without ?ids=."""
+    if args is None:
+        args = request.args
+    value = args.get("ids")
+    if value is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(",") if part.strip()))
+    except ValueError:
+        raise APIException("'ids' must be a comma separated list of integers", status_code=400)
+    if not ids or len(ids) > MULTIGET_MAX_IDS:
+        raise APIException(f"'ids' takes 1 to {MULTIGET_MAX_IDS} ids", status_code=400)
+    return ids
+
+
+def page_serializer(model, fields, serializer):
+    # ?fields= only selects the requested columns (plus the key for the cursor)
+    return ColumnSerializer(model, fields) if fields else serializer
+
+
+def select_page(serializer, after=None, where=()):
+    stmt = serializer.select().where(*where)
+    if after is not None:
+        stmt = stmt.where(serializer.pk > after)
+    return stmt.order_by(serializer.pk)
+
+
+def split_page(rows, limit):
+    """The rows of a `limit + 1` query and whether there is a next page."""
+    return rows[:limit], len(rows) > limit
+
+
+def paginate(model, serializer):
+    """Returns (items, next_cursor) for the current request's limit/after/fields."""
+    limit, after, fields = page_args(model)
+    serializer = page_serializer(model, fields, serializer)
+    stmt = select_page(serializer, after, search_filters(model, request.args, db.engine))
+    rows, has_more = split_page(db.session.execute(stmt.limit(limit + 1)).all(), limit)
+
+    related = serializer.related_select(rows)
+    related = db.session.execute(related).all() if related is not None else None
+    items = serializer.serialize_rows(rows, related)
+    return items, rows[-1]._cursor if has_more else None
+
+
+def select_ids(serializer, ids, where=()):
+    return serializer.select().where(serializer.pk.in_(ids), *where)
+
+
+def in_order(ids, rows, items):
+    """(items in the order of `ids`, the ids without a row)."""
+    by_id = {row._cursor: item for row, item in zip(rows, items)}
+    return [by_id[id] for id in ids if id in by_id], [id for id in ids if id not in by_id]
+
+
+def fetch_ids(serializer, ids, where=()):
+    rows = db.session.execute(select_ids(serializer, ids, where)).all()
+    related = serializer.related_select(rows)
+    related = db.session.execute(related).all() if related is not None else None
+    return in_order(ids, rows, serializer.serialize_rows(rows, related))
+
+
+def multiget(model, serializer, ids):
+    """(items, missing) of ?ids=, honouring ?fields= and the search filters."""
+    _, _, fields = page_args(model)
+    serializer = page_serializer(model, fields, serializer)
+    return fetch_ids(serializer, ids, search_filters(model, request.args, db.engine))
+
+
+def page_response(key, model, serializer, cached=False):
+    ids = ids_arg()
+    if ids is None and wants_stream():
+        # export mode: every row after the cursor, ignoring limit
+        _, after, fields = page_args(model)
+        serializer = page_serializer(model, fields, serializer)
+        return stream_rows(select_page(serializer, after, search_filters(model, request.args, db.engine)), serializer)
+
+    def build():
+        if ids is not None:
+            items, missing = multiget(model, serializer, ids)
+            return {key: items, "missing": missing}
+        items, next_cursor = paginate(model, serializer)
+        return {key: items, "next": next_cursor}
+
+    if cached:
+        # the page depends only on the query string and the table contents
+        return jsonify(catalog_cache.get_or_load(model.__tablename__, request.full_path, build))
+    return jsonify(build())
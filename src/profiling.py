@@ -0,0 +1,128 @@
+"""
+Opt-in per-request profiling, enabled with PROFILE_REQUESTS=1.
+
+Every response of the Flask app (API and Flask-Admin views) gets a Server-Timing
+header with the wall time, the number of SQL statements and the time spent in
+the database, in the serializers (and the models' serialize* methods) and in jsonify:
+
+    Server-Timing: total;dur=41.2, db;dur=12.8;desc="5 queries", serialize;dur=20.1, jsonify;dur=3.4
+
+With PROFILE_DUMP_DIR set, requests slower than PROFILE_SLOW_MS (default 500) are
+also run under cProfile and their stats written there (open with pstats or snakeviz).
+When PROFILE_REQUESTS is not set nothing is installed, so there is no overhead.
+"""
+import cProfile
+import os
+import re
+import time
+from functools import wraps
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flags import env_flag
+from models import db
+import serializers
+
+PROFILE_REQUESTS = env_flag("PROFILE_REQUESTS", "0")
+PROFILE_DUMP_DIR = os.getenv("PROFILE_DUMP_DIR")
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 500))
+
+
+def current_profile():
+    if has_request_context():
+        return g.get("profile")
+    return None
+
+
+def timed(bucket, func):
+    """Adds the time spent in `func` to g.profile[bucket], nested calls are counted once."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile()
+        if profile is None or profile["depth"].get(bucket):
+            return func(*args, **kwargs)
+        profile["depth"][bucket] = True
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile[bucket] += time.perf_counter() - started
+            profile["depth"][bucket] = False
+    return wrapper
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # one slot per connection: its statements run one at a time, and the start of one
+    # that raised (no after_cursor_execute) is just overwritten by the next
+    conn.info["query_started"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started")
+    profile = current_profile()
+    if profile is not None:
+        profile["queries"] += 1
+        profile["db"] += time.perf_counter() - started
+
+
+def start_request():
+    g.profile = {"started": time.perf_counter(), "queries": 0, "db": 0.0,
+                 "serialize": 0.0, "jsonify": 0.0, "depth": {}}
+    if PROFILE_DUMP_DIR:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def finish_request(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    total = (time.perf_counter() - profile["started"]) * 1000
+    response.headers.add("Server-Timing", ", ".join([
+        f"total;dur={total:.1f}",
+        f'db;dur={profile["db"] * 1000:.1f};desc="{profile["queries"]} queries"',
+        f"serialize;dur={profile['serialize'] * 1000:.1f}",
+        f"jsonify;dur={profile['jsonify'] * 1000:.1f}",
+    ]))
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        if total >= PROFILE_SLOW_MS:
+            name = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+            path = os.path.join(PROFILE_DUMP_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{name}-{int(total)}ms.pstats")
+            profiler.dump_stats(path)
+    return response
+
+
+def stop_profiler(exc):
+    # after_request is skipped when the view raised
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def install_profiling(app, enabled=PROFILE_REQUESTS):
+    if not enabled:
+        return
+    if PROFILE_DUMP_DIR:
+        os.makedirs(PROFILE_DUMP_DIR, exist_ok=True)
+
+    # process wide, once for all the apps (the API and the lazily built admin app)
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+        for mapper in db.Model.registry.mappers:
+            model = mapper.class_
+            for name, method in list(vars(model).items()):
+                if name.startswith("serialize") and callable(method):
+                    setattr(model, name, timed("serialize", method))
+        for serializer in (serializers.ColumnSerializer, *serializers.ColumnSerializer.__subclasses__()):
+            if "serialize_rows" in vars(serializer):
+                serializer.serialize_rows = timed("serialize", vars(serializer)["serialize_rows"])
+    app.json.response = timed("jsonify", app.json.response)
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(stop_profiler)
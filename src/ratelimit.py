@@ -0,0 +1,183 @@
+"""
+Rate limiting and admission control for the write endpoints.
+
+Rate limit: a token bucket per client and route, refilled at RATE_LIMIT_PER_SECOND
+tokens per second up to RATE_LIMIT_BURST. Disabled unless RATE_LIMIT_PER_SECOND is
+set. Buckets live in the worker, or in Redis with RATE_LIMIT_REDIS_URL so all the
+workers share them ("local" for the in-process stand-in). Behind a proxy set
+RATE_LIMIT_TRUSTED_PROXIES to the number of proxies (1 on Render / Heroku), the
+client is then read from X-Forwarded-For.
+
+Admission control: when the p95 wait for a database connection over the last
+ADMISSION_WINDOW seconds exceeds ADMISSION_MAX_WAIT_MS, writes queue for one of
+ADMISSION_SLOTS slots per worker, at most ADMISSION_QUEUE_TIMEOUT seconds, and are
+shed after that. The reads keep the rest of the pool. ADMISSION_MAX_WAIT_MS=0
+disables it.
+
+Rejected requests get a 429 with Retry-After. GET /metrics shows the admitted,
+queued, rate_limited and shed counts per route.
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import jsonify, request
+from cache import LRUCache
+from db_pool import recent_pool_wait
+
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", 0))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 10))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))
+
+ADMISSION_MAX_WAIT_MS = float(os.getenv("ADMISSION_MAX_WAIT_MS", 100))
+ADMISSION_WINDOW = float(os.getenv("ADMISSION_WINDOW", 5))
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", 2))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 2))
+
+
+class TokenBuckets:
+    """Token buckets of this process, also the stand-in for the shared backend."""
+
+    def __init__(self, maxsize=100000):
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Takes a token from bucket `key`. Returns 0 on success, otherwise the
+        seconds until the next token."""
+        now = time.monotonic()
+        # a bucket left alone that long is full again, the entry can go
+        ttl = burst / rate + 1
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets.set(key, (tokens - 1, now), ttl=ttl)
+                return 0.0
+            self._buckets.set(key, (tokens, now), ttl=ttl)
+            return (1 - tokens) / rate
+
+
+# same algorithm, atomic in Redis, on the server's clock
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local tokens = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'last', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisTokenBuckets:
+    def __init__(self, client, prefix="ratelimit"):
+        self.prefix = prefix
+        self.script = client.register_script(TAKE_SCRIPT)
+        # per worker limits while Redis is unreachable, rather than none or errors
+        self.fallback = TokenBuckets()
+
+    def take(self, key, rate, burst):
+        import redis
+        try:
+            return float(self.script(keys=[f"{self.prefix}:{key}"], args=[rate, burst]))
+        except redis.RedisError:
+            return self.fallback.take(key, rate, burst)
+
+
+def token_buckets(url):
+    if not url or url == "local":
+        return TokenBuckets()
+    try:
+        import redis
+    except ImportError:
+        print("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed, using per worker buckets")
+        return TokenBuckets()
+    return RedisTokenBuckets(redis.Redis.from_url(url))
+
+
+buckets = token_buckets(RATE_LIMIT_REDIS_URL)
+admission_slots = threading.BoundedSemaphore(ADMISSION_SLOTS)
+
+
+class AdmissionStats:
+    OUTCOMES = ("admitted", "queued", "rate_limited", "shed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def count(self, route, outcome):
+        with self._lock:
+            self._counts[(route, outcome)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        routes = sorted({route for route, _ in counts})
+        return {route: {outcome: counts.get((route, outcome), 0) for outcome in self.OUTCOMES}
+                for route in routes}
+
+
+admission_stats = AdmissionStats()
+
+
+def admission_status():
+    return {
+        "rate_limit": {"per_second": RATE_LIMIT_PER_SECOND, "burst": RATE_LIMIT_BURST}
+        if RATE_LIMIT_PER_SECOND else None,
+        "pool_wait_p95_ms": round(recent_pool_wait(ADMISSION_WINDOW) * 1000, 3),
+        "max_wait_ms": ADMISSION_MAX_WAIT_MS,
+        "routes": admission_stats.snapshot(),
+    }
+
+
+def client_id():
+    route = request.access_route
+    if RATE_LIMIT_TRUSTED_PROXIES and request.headers.get("X-Forwarded-For"):
+        # the address the outermost trusted proxy saw, clients can prepend anything
+        return route[max(len(route) - RATE_LIMIT_TRUSTED_PROXIES, 0)]
+    return request.remote_addr
+
+
+def too_many_requests(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def overloaded():
+    return ADMISSION_MAX_WAIT_MS and recent_pool_wait(ADMISSION_WINDOW) * 1000 > ADMISSION_MAX_WAIT_MS
+
+
+def rate_limited(view):
+    """Applies the rate limit and the admission control to `view`."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        route = request.endpoint
+        if RATE_LIMIT_PER_SECOND:
+            wait = buckets.take(f"{route}:{client_id()}", RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+            if wait:
+                admission_stats.count(route, "rate_limited")
+                return too_many_requests("too many requests, slow down", wait)
+
+        if not overloaded():
+            admission_stats.count(route, "admitted")
+            return view(*args, **kwargs)
+
+        if not admission_slots.acquire(timeout=ADMISSION_QUEUE_TIMEOUT):
+            admission_stats.count(route, "shed")
+            return too_many_requests("the database is overloaded, try again later", ADMISSION_QUEUE_TIMEOUT)
+        admission_stats.count(route, "queued")
+        try:
+            return view(*args, **kwargs)
+        finally:
+            admission_slots.release()
+    return wrapper
@@ -0,0 +1,149 @@
+"""
+person_favorites read model: every person's favorites list, pre-serialized, so
+/persons is one query on two tables instead of a favorites tree per page.
+
+Enabled with FAVORITES_READ_MODEL=1. Rows are refreshed in the same transaction
+as the write that changes them: ORM writes (API, Flask-Admin, shell) are picked
+up by model events, the Core statements of the bulk endpoints call
+refresh_persons() themselves. Backfill and verify with
+
+    flask read-model rebuild
+    flask read-model check
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from flags import env_flag
+from models import db, Person, PersonFavorites, Favorite, Character, Planet, Vehicle
+from serializers import FavoriteSerializer, PersonReadSerializer, PersonSerializer
+
+READ_MODEL = env_flag("FAVORITES_READ_MODEL", "0")
+REBUILD_BATCH_SIZE = 1000
+
+# joins, not the catalog snapshot: a catalog update refreshes the read model before it commits
+FAVORITES = FavoriteSerializer(with_relations=True, snapshot=False)
+CATALOG_COLUMNS = {Character: Favorite.character_id, Planet: Favorite.planet_id, Vehicle: Favorite.vehicle_id}
+
+
+def person_serializer(enabled=READ_MODEL):
+    return PersonReadSerializer() if enabled else PersonSerializer()
+
+
+def favorites_by_person(session, person_ids):
+    """{person_id: [favorite, ...]} computed from the favorites tables."""
+    favorites = {}
+    rows = session.execute(FAVORITES.select().where(Favorite.person_id.in_(person_ids))
+                           .order_by(Favorite.favorite_id))
+    for row in rows:
+        favorites.setdefault(row.person_id, []).append(FAVORITES.serialize_row(row))
+    return favorites
+
+
+def refresh_persons(session, person_ids):
+    """Rewrites the read model rows of `person_ids`, call before committing a Core write."""
+    person_ids = sorted(set(person_ids))
+    if not person_ids:
+        return
+    # serializes concurrent refreshes of a person, so the last one sees every committed favorite.
+    # FOR NO KEY UPDATE on PostgreSQL does not wait for the key share locks of favorites inserts
+    session.execute(db.select(Person.person_id).where(Person.person_id.in_(person_ids))
+                    .order_by(Person.person_id).with_for_update(key_share=True))
+    favorites = favorites_by_person(session, person_ids)
+    session.execute(db.delete(PersonFavorites).where(PersonFavorites.person_id.in_(person_ids)))
+    if favorites:
+        session.execute(db.insert(PersonFavorites),
+                        [{"person_id": pid, "favorites": items} for pid, items in favorites.items()])
+
+
+def stale_persons(session):
+    return session.info.setdefault("read_model_persons", set())
+
+
+def mark_favorite(mapper, connection, target):
+    persons = stale_persons(object_session(target))
+    persons.add(target.person_id)
+    # a favorite moved to another person leaves the old one stale too
+    persons.update(p for p in inspect(target).attrs.person_id.history.deleted if p is not None)
+
+
+def mark_person(mapper, connection, target):
+    # the favorites embed their person
+    stale_persons(object_session(target)).add(target.person_id)
+
+
+def mark_catalog(mapper, connection, target):
+    pk = mapper.primary_key_from_instance(target)[0]
+    object_session(target).info.setdefault("read_model_catalog", []).append((CATALOG_COLUMNS[type(target)], pk))
+
+
+def refresh_after_flush(session, flush_context):
+    persons = session.info.pop("read_model_persons", set())
+    for column, pk in session.info.pop("read_model_catalog", ()):
+        persons.update(session.scalars(db.select(Favorite.person_id).where(column == pk)))
+    refresh_persons(session, persons)
+
+
+def register_read_model(enabled=READ_MODEL):
+    if not enabled:
+        return
+    for name in ("after_insert", "after_update", "after_delete"):
+        event.listen(Favorite, name, mark_favorite)
+    for name in ("after_update", "after_delete"):
+        event.listen(Person, name, mark_person)
+        for model in CATALOG_COLUMNS:
+            event.listen(model, name, mark_catalog)
+    event.listen(Session, "after_flush_postexec", refresh_after_flush)
+
+
+def person_batches(session):
+    ids = session.scalars(db.select(Person.person_id).order_by(Person.person_id)).all()
+    for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+        yield ids[start:start + REBUILD_BATCH_SIZE]
+
+
+read_model_cli = AppGroup("read-model", help="Maintain the person_favorites read model.")
+
+
+def rebuild_read_model(session):
+    """Recomputes every row of person_favorites, the caller commits. Returns the persons count."""
+    session.execute(db.delete(PersonFavorites))
+    count = 0
+    for ids in person_batches(session):
+        refresh_persons(session, ids)
+        count += len(ids)
+    return count
+
+
+@read_model_cli.command("rebuild")
+def rebuild():
+    """Recomputes every row of person_favorites."""
+    session = db.session
+    count = rebuild_read_model(session)
+    session.commit()
+    click.echo(f"person_favorites rebuilt for {count} persons")
+
+
+@read_model_cli.command("check")
+@click.option("--fix", is_flag=True, help="Rewrite the rows that differ.")
+def check(fix):
+    """Compares person_favorites with the favorites tables, exits 1 on differences."""
+    session = db.session
+    stored = dict(session.execute(db.select(PersonFavorites.person_id, PersonFavorites.favorites)).all())
+    stale = []
+    for ids in person_batches(session):
+        expected = favorites_by_person(session, ids)
+        stale += [pid for pid in ids if stored.pop(pid, None) != expected.get(pid)]
+    # rows left belong to deleted persons
+    stale += list(stored)
+
+    if not stale:
+        click.echo("person_favorites is consistent")
+        return
+    click.echo(f"{len(stale)} stale persons: {', '.join(map(str, stale[:20]))}{' ...' if len(stale) > 20 else ''}")
+    if fix:
+        refresh_persons(session, stale)
+        session.commit()
+        click.echo("fixed")
+    else:
+        raise SystemExit(1)
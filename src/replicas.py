@@ -0,0 +1,200 @@
+"""
+Read replicas: the reads of GET requests go to a replica, everything else to DATABASE_URL.
+
+    REPLICA_DATABASE_URLS=postgresql://replica-1/db,postgresql://replica-2/db
+
+A statement is sent to the primary instead when
+- the request is not a GET / HEAD (nor a view marked @read_only), or its session
+  already wrote (flush or DML),
+- the client wrote less than REPLICA_STICKY_SECONDS ago: write responses set a
+  short-lived cookie, so a client reads its own writes,
+- one of its tables was written less than REPLICA_MAX_LAG seconds ago (the write
+  times of cache.py), so the catalog cache never stores rows a lagging replica
+  still has in their old state,
+- no replica is healthy. A background thread checks them every
+  REPLICA_HEALTH_INTERVAL seconds (SELECT 1, and on PostgreSQL the replay lag
+  against REPLICA_MAX_LAG), a disconnect marks a replica down at once.
+
+A session sticks to the replica it first read from. Flask-Admin always uses the
+primary. Locally, two SQLite files work as primary and "replica" (nothing
+replicates them, which makes the routing easy to see).
+"""
+import os
+import random
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.util import find_tables
+
+REPLICA_DATABASE_URLS = [url.strip().replace("postgres://", "postgresql://")
+                         for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 2))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", 10))
+
+STICKY_COOKIE = "read_primary"
+
+# tables whose writes are recorded (cache.touch) under another name
+WRITTEN_AS = {"favorite_counts": "favorites", "person_favorites": "favorites"}
+
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_binds(engine_options):
+    """SQLALCHEMY_BINDS entries for the replicas, named replica_0, replica_1, ..."""
+    return {f"replica_{n}": {"url": url, **engine_options(url)} for n, url in enumerate(REPLICA_DATABASE_URLS)}
+
+
+def replica_healthy(engine):
+    try:
+        with engine.connect() as connection:
+            if engine.dialect.name == "postgresql":
+                lag = connection.scalar(LAG_QUERY)
+                return lag is None or float(lag) <= REPLICA_MAX_LAG
+            connection.execute(text("SELECT 1"))
+            return True
+    except SQLAlchemyError:
+        return False
+
+
+class Replicas:
+    """The replica engines of this process and their health."""
+
+    def __init__(self):
+        self.engines = {}
+        self.healthy = {}
+        self._lock = threading.Lock()
+        self._checker_pid = None
+
+    def add(self, name, engine):
+        self.engines[name] = engine
+        self.healthy[name] = True
+
+        @event.listens_for(engine, "handle_error")
+        def mark_down(context):
+            # connection refused, or lost
+            if context.is_disconnect or context.connection is None:
+                self.healthy[name] = False
+
+    def check(self):
+        for name, engine in list(self.engines.items()):
+            self.healthy[name] = replica_healthy(engine)
+
+    def run_checks(self):
+        while True:
+            time.sleep(REPLICA_HEALTH_INTERVAL)
+            self.check()
+
+    def ensure_checker(self):
+        # threads do not survive a fork, every gunicorn worker starts its own
+        if self._checker_pid != os.getpid():
+            with self._lock:
+                if self._checker_pid != os.getpid():
+                    # before the first read, not after it failed
+                    self.check()
+                    self._checker_pid = os.getpid()
+                    threading.Thread(target=self.run_checks, name="replica-health", daemon=True).start()
+
+    def pick(self):
+        self.ensure_checker()
+        names = [name for name, healthy in self.healthy.items() if healthy]
+        return random.choice(names) if names else None
+
+    def status(self):
+        return dict(self.healthy)
+
+
+replicas = Replicas()
+
+
+def recently_written(tables):
+    from cache import catalog_cache
+    now = time.time()
+    for table in tables:
+        modified = catalog_cache.modified(WRITTEN_AS.get(table, table))
+        if modified is not None and now - modified < REPLICA_MAX_LAG:
+            return True
+    return False
+
+
+def statement_tables(mapper, clause):
+    if clause is not None:
+        return {table.name for table in find_tables(clause, include_joins=True)}
+    return {mapper.local_table.name}
+
+
+class ReplicaRouting:
+    """get_bind() of a Session that sends reads to a replica. Subclasses define
+    read_request(), the (method, cookies) of the current request or None outside of one,
+    and replica_engine(name), the engine of a replica or None."""
+
+    def route(self, mapper, clause):
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info["wrote"] = True
+            return None
+        if self.info.get("wrote") or not replicas.engines or (mapper is None and clause is None):
+            return None
+        current = self.read_request()
+        if current is None:
+            return None
+        method, cookies = current
+        if method not in ("GET", "HEAD") or cookies.get(STICKY_COOKIE):
+            return None
+        if recently_written(statement_tables(mapper, clause)):
+            return None
+        name = self.info.get("replica")
+        if name is None or not replicas.healthy.get(name):
+            name = self.info["replica"] = replicas.pick()
+        return self.replica_engine(name) if name else None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = self.route(mapper, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Routes the reads of a view that only reads but is not a GET (POST /batch) like a GET's."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(ReplicaRouting, FlaskSession):
+    """db.session (see models.py)."""
+
+    def read_request(self):
+        if not has_request_context():
+            return None
+        return ("GET" if g.get("read_only") else request.method), request.cookies
+
+    def replica_engine(self, name):
+        # apps without replica binds (Flask-Admin) have none
+        return self._db.engines.get(name)
+
+
+def install_replicas(app, db):
+    """Registers the replica engines of `app` and the read-your-writes cookie."""
+    from db_pool import register_engine
+    with app.app_context():
+        for name, engine in db.engines.items():
+            if name is not None and name.startswith("replica_"):
+                replicas.add(name, engine)
+                register_engine(name, engine)
+
+    @app.after_request
+    def stick_to_primary(response):
+        if replicas.engines and db.session.info.get("wrote"):
+            response.set_cookie(STICKY_COOKIE, "1", max_age=REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax")
+        return response
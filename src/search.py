@@ -0,0 +1,151 @@
+"""
+?q= name search and typed filters for the catalog lists.
+
+    GET /characters?q=sky              names containing "sky" (case-insensitive)
+    GET /characters?q=luke*            names starting with "luke"
+    GET /planets?surfice_min=1000&surfice_max=5000
+    GET /vehicles?model=Model 7
+
+Filters are ANDed and combine with the keyset pagination, ?fields= and ?stream=1.
+The searchable and filterable fields are declared on the models (api_search,
+api_filters). Name search is served by a pg_trgm GIN index on PostgreSQL and by
+an FTS5 trigram table on SQLite, both created by create_search_indexes(); when
+they could not be created (no pg_trgm, SQLite without FTS5) or for SQLite terms
+under three characters the same LIKE runs as a scan.
+"""
+from sqlalchemy import column, event, inspect, table, text
+from utils import APIException
+from models import db, Character, Planet, Vehicle
+
+SEARCHABLE = (Character, Planet, Vehicle)
+
+# sqlite table name -> whether its FTS5 table exists, checked once per process
+_fts_tables = {}
+
+
+def search_column(model):
+    return getattr(model, model.api_fields[model.api_search])
+
+
+def fts_name(model):
+    return f"{model.__tablename__}_fts"
+
+
+def fts_table(model, engine):
+    """The FTS5 table of `model` as a lightweight table() construct, or None."""
+    if engine.dialect.name != "sqlite":
+        return None
+    name = fts_name(model)
+    if name not in _fts_tables:
+        _fts_tables[name] = inspect(engine).has_table(name)
+    return table(name, column("rowid"), column(name)) if _fts_tables[name] else None
+
+
+def escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_search(model, q, engine):
+    prefix = q.endswith("*")
+    term = q.rstrip("*")
+    if not term:
+        return []
+    pattern = escape_like(term) + "%"
+    clauses = [search_column(model).ilike(pattern if prefix else "%" + pattern, escape="\\")]
+
+    fts = fts_table(model, engine)
+    if fts is not None and len(term) >= 3:
+        # the trigram index narrows the rows down, the LIKE above keeps the exact semantics
+        phrase = '"' + term.replace('"', '""') + '"'
+        pk = model.__mapper__.primary_key[0]
+        clauses.append(pk.in_(db.select(fts.c.rowid).where(fts.c[fts.name].match(phrase))))
+    return clauses
+
+
+def parse_value(model, field, name, value):
+    python_type = getattr(model, model.api_fields[field]).type.python_type
+    try:
+        return python_type(value)
+    except ValueError:
+        raise APIException(f"'{name}' must be of type {python_type.__name__}", status_code=400)
+
+
+def search_filters(model, args, engine):
+    """WHERE clauses for the ?q= and filter parameters in `args`."""
+    clauses = []
+    q = args.get("q")
+    if q is not None:
+        if getattr(model, "api_search", None) is None:
+            raise APIException("search (?q=) is not supported on this collection", status_code=400)
+        if q.strip():
+            clauses += name_search(model, q.strip(), engine)
+
+    for field, kind in getattr(model, "api_filters", {}).items():
+        attribute = getattr(model, model.api_fields[field])
+        if field in args:
+            clauses.append(attribute == parse_value(model, field, field, args[field]))
+        if kind == "range":
+            for suffix, compare in (("_min", attribute.__ge__), ("_max", attribute.__le__)):
+                if field + suffix in args:
+                    clauses.append(compare(parse_value(model, field, field + suffix, args[field + suffix])))
+    return clauses
+
+
+def create_search_indexes(connection):
+    """Creates the name search indexes the dialect supports, skipping them when the
+    extension is missing. Used by db.create_all(), migration b7f3c9d2e481 has its own
+    frozen copy of the DDL."""
+    dialect = connection.dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        return
+    try:
+        with connection.begin_nested():
+            if dialect == "postgresql":
+                connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for model in SEARCHABLE:
+                for statement in search_index_ddl(dialect, model):
+                    connection.execute(text(statement))
+    except Exception as e:
+        print(f"search indexes not created, ?q= falls back to LIKE scans: {e}")
+    _fts_tables.clear()
+
+
+def search_index_ddl(dialect, model):
+    tablename = model.__tablename__
+    name = search_column(model).key
+    pk = model.__mapper__.primary_key[0].key
+    if dialect == "postgresql":
+        return [f"CREATE INDEX IF NOT EXISTS ix_{tablename}_{name}_trgm ON {tablename} USING gin ({name} gin_trgm_ops)"]
+
+    fts = fts_name(model)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({name}, content='{tablename}', "
+        f"content_rowid='{pk}', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tablename} BEGIN "
+        f"INSERT INTO {fts}(rowid, {name}) VALUES (new.{pk}, new.{name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {name}) VALUES ('delete', old.{pk}, old.{name}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {tablename} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {name}) VALUES ('delete', old.{pk}, old.{name}); "
+        f"INSERT INTO {fts}(rowid, {name}) VALUES (new.{pk}, new.{name}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def drop_search_indexes(connection):
+    dialect = connection.dialect.name
+    for model in SEARCHABLE:
+        tablename, name = model.__tablename__, search_column(model).key
+        if dialect == "postgresql":
+            connection.execute(text(f"DROP INDEX IF EXISTS ix_{tablename}_{name}_trgm"))
+        elif dialect == "sqlite":
+            fts = fts_name(model)
+            for trigger in ("ai", "ad", "au"):
+                connection.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{trigger}"))
+            connection.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+    _fts_tables.clear()
+
+
+@event.listens_for(db.metadata, "after_create")
+def create_after_create_all(target, connection, **kw):
+    create_search_indexes(connection)
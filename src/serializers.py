@@ -0,0 +1,154 @@
+"""
+Column driven serializers: the list endpoints build their dicts straight from
+SQLAlchemy Row tuples instead of hydrating ORM instances and calling the models'
+serialize methods. The output is the same as the matching model method.
+
+A serializer gives pagination/streaming a statement whose `_cursor` column is the
+primary key, an optional second statement for nested rows (fetched once per page
+or per streamed batch) and turns both into dicts.
+"""
+from models import db, Person, PersonFavorites, Favorite, Character, Planet, Vehicle
+from catalog_snapshot import catalog_snapshot
+
+
+def labelled(model, prefix, fields=None):
+    return [getattr(model, model.api_fields[f]).label(f"{prefix}{f}") for f in fields or model.api_fields]
+
+
+def unlabelled(row, model, prefix, fields=None):
+    mapping = row._mapping
+    return {f: mapping[f"{prefix}{f}"] for f in fields or model.api_fields}
+
+
+class ColumnSerializer:
+    """Any model, the columns of `fields` (default: every api field, i.e. model.serialize())."""
+
+    # whether serialize_rows() reads catalog_snapshot
+    snapshot = False
+
+    def __init__(self, model, fields=None):
+        self.model = model
+        self.fields = fields
+        self.pk = model.__mapper__.primary_key[0]
+
+    def select(self):
+        return db.select(self.pk.label("_cursor"), *labelled(self.model, "", self.fields))
+
+    def related_select(self, rows):
+        return None
+
+    def serialize_rows(self, rows, related=None):
+        return [unlabelled(row, self.model, "", self.fields) for row in rows]
+
+
+# (key in Favorite.serialize, key in Favorite.serialize_with_relations, model, relationship, column)
+FAVORITE_CATALOG = (
+    ("characters", "character", Character, Favorite.characters, Favorite.character_id),
+    ("planet", "planets", Planet, Favorite.planets, Favorite.planet_id),
+    ("vehicle", "vehicles", Vehicle, Favorite.vehicles, Favorite.vehicle_id),
+)
+
+
+class FavoriteSerializer(ColumnSerializer):
+    """Favorite.serialize(), or Favorite.serialize_with_relations() with `with_relations`.
+
+    The catalog rows come from catalog_snapshot.py rather than joins, unless
+    `snapshot` is False (rows the current transaction may have changed)."""
+
+    def __init__(self, with_relations=False, snapshot=True):
+        super().__init__(Favorite)
+        self.with_relations = with_relations
+        self.snapshot = snapshot
+
+    def select(self):
+        columns = [Favorite.favorite_id.label("_cursor"), Favorite.person_id]
+        fields = None if self.with_relations else ("id", "name")
+        for _, _, model, _, column in FAVORITE_CATALOG:
+            if self.snapshot:
+                columns.append(column)
+            else:
+                columns += labelled(model, f"{model.__tablename__}_", fields)
+        if self.with_relations:
+            columns += labelled(Person, "persons_")
+
+        stmt = db.select(*columns).select_from(Favorite)
+        if not self.snapshot:
+            for _, _, model, relationship, _ in FAVORITE_CATALOG:
+                stmt = stmt.outerjoin(model, relationship)
+        if self.with_relations:
+            stmt = stmt.join(Person, Favorite.person)
+        return stmt
+
+    def catalog_item(self, row, model, column, tables, fields=None):
+        if self.snapshot:
+            item_id = getattr(row, column.key)
+            return tables[model].item(item_id, fields) if item_id is not None else None
+        prefix = f"{model.__tablename__}_"
+        if row._mapping[f"{prefix}id"] is None:
+            return None
+        return unlabelled(row, model, prefix, fields)
+
+    def serialize_row(self, row, tables=None):
+        if self.snapshot and tables is None:
+            tables = catalog_snapshot.tables()
+        data = {"person_id": row.person_id}
+        for short_key, full_key, model, _, column in FAVORITE_CATALOG:
+            if self.with_relations:
+                item = self.catalog_item(row, model, column, tables)
+                if item is not None:
+                    data[short_key] = {"id": item["id"], "name": item["name"]}
+                data[full_key] = item
+            else:
+                item = self.catalog_item(row, model, column, tables, ("id", "name"))
+                if item is not None:
+                    data[short_key] = item
+        if self.with_relations:
+            data["person"] = unlabelled(row, Person, "persons_")
+        return data
+
+    def serialize_rows(self, rows, related=None):
+        tables = catalog_snapshot.tables() if self.snapshot else None
+        return [self.serialize_row(row, tables) for row in rows]
+
+
+class PersonSerializer(ColumnSerializer):
+    """Person.serialize_with_relations(): one query for the persons of the page and one
+    for all their favorites, whatever the page size."""
+
+    def __init__(self):
+        super().__init__(Person)
+        self.favorites = FavoriteSerializer(with_relations=True)
+        self.snapshot = self.favorites.snapshot
+
+    def related_select(self, rows):
+        ids = [row._cursor for row in rows]
+        if not ids:
+            return None
+        return self.favorites.select().where(Favorite.person_id.in_(ids)).order_by(Favorite.favorite_id)
+
+    def serialize_rows(self, rows, related=None):
+        favorites = {}
+        tables = catalog_snapshot.tables() if related else None
+        for row in related or ():
+            favorites.setdefault(row.person_id, []).append(self.favorites.serialize_row(row, tables))
+        items = super().serialize_rows(rows)
+        for row, item in zip(rows, items):
+            item["favorites"] = favorites.get(row._cursor, [])
+        return items
+
+
+class PersonReadSerializer(ColumnSerializer):
+    """PersonSerializer's output in one query, from the person_favorites read model."""
+
+    def __init__(self):
+        super().__init__(Person)
+
+    def select(self):
+        return (super().select().add_columns(PersonFavorites.favorites.label("_favorites"))
+                .outerjoin(PersonFavorites, PersonFavorites.person_id == Person.person_id))
+
+    def serialize_rows(self, rows, related=None):
+        items = super().serialize_rows(rows)
+        for row, item in zip(rows, items):
+            item["favorites"] = row._favorites or []
+        return items
@@ -0,0 +1,191 @@
+"""
+Favorite counters and the stats endpoints built on them.
+
+    GET /stats/top/characters?limit=10    most favorited characters (or planets, vehicles, persons)
+    GET /stats/persons?limit=100&after=   favorites per person, keyset paginated
+
+favorite_counts holds the number of favorites of every person and catalog row.
+It is updated in the transaction of each favorite write: ORM writes (API,
+Flask-Admin, shell) through model events, the Core statements of the bulk
+endpoints through apply_counts(). Reads touch only the counter rows they return
+and are cached until the next favorite write. `flask stats rebuild` recomputes
+the table with GROUP BY queries over favorites.
+"""
+import os
+from collections import Counter
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, literal
+from sqlalchemy.orm import Session, object_session
+from utils import APIException
+from models import db, Person, Favorite, FavoriteCount, Character, Planet, Vehicle
+from cache import catalog_cache, touch
+from pagination import page_args, split_page
+
+STATS_TOP_MAX = int(os.getenv("STATS_TOP_MAX", 100))
+
+# kind -> (favorites column, model, api field returned next to the id)
+KINDS = {
+    "persons": (Favorite.person_id, Person, "nickname"),
+    "characters": (Favorite.character_id, Character, "name"),
+    "planets": (Favorite.planet_id, Planet, "name"),
+    "vehicles": (Favorite.vehicle_id, Vehicle, "name"),
+}
+
+
+def favorite_deltas(favorites, sign=1, counter=None):
+    """Counter deltas of favorites given as mappings of their columns."""
+    counter = Counter() if counter is None else counter
+    for favorite in favorites:
+        for kind, (column, _, _) in KINDS.items():
+            if favorite.get(column.key):
+                counter[(kind, favorite[column.key])] += sign
+    return counter
+
+
+def increment_statement(session):
+    table = FavoriteCount.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(index_elements=[table.c.kind, table.c.item_id],
+                                          set_={"total": table.c.total + stmt.excluded.total})
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update(total=table.c.total + stmt.inserted.total)
+    raise RuntimeError(f"favorite counters are not supported on '{dialect}' databases")
+
+
+def apply_counts(session, counter):
+    """Adds `counter` to favorite_counts in the session's transaction. The increments are
+    relative, so concurrent writers cannot lose each other's updates."""
+    # sorted, so concurrent transactions lock the counter rows in the same order
+    rows = [{"kind": kind, "item_id": item_id, "total": delta}
+            for (kind, item_id), delta in sorted(counter.items()) if delta]
+    if not rows:
+        return
+    session.execute(increment_statement(session), rows)
+    touch(session, "favorites")
+
+
+def pending_counts(session):
+    return session.info.setdefault("favorite_count_deltas", Counter())
+
+
+def columns_of(favorite):
+    return {column.key: getattr(favorite, column.key) for column, _, _ in KINDS.values()}
+
+
+def count_insert(mapper, connection, target):
+    favorite_deltas([columns_of(target)], 1, pending_counts(object_session(target)))
+
+
+def count_delete(mapper, connection, target):
+    favorite_deltas([columns_of(target)], -1, pending_counts(object_session(target)))
+
+
+def count_update(mapper, connection, target):
+    state = inspect(target)
+    counter = pending_counts(object_session(target))
+    for kind, (column, _, _) in KINDS.items():
+        history = state.attrs[column.key].history
+        if history.deleted or history.added:
+            for old in history.deleted:
+                if old:
+                    counter[(kind, old)] -= 1
+            for new in history.added:
+                if new:
+                    counter[(kind, new)] += 1
+
+
+def apply_after_flush(session, flush_context):
+    counter = session.info.pop("favorite_count_deltas", None)
+    if counter:
+        apply_counts(session, counter)
+
+
+def register_counters():
+    event.listen(Favorite, "after_insert", count_insert)
+    event.listen(Favorite, "after_delete", count_delete)
+    event.listen(Favorite, "after_update", count_update)
+    event.listen(Session, "after_flush_postexec", apply_after_flush)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_pending_counts(session):
+    session.info.pop("favorite_count_deltas", None)
+
+
+def top_limit(args):
+    try:
+        limit = int(args.get("limit", 10))
+    except ValueError:
+        raise APIException("'limit' must be an integer", status_code=400)
+    if not 1 <= limit <= STATS_TOP_MAX:
+        raise APIException(f"'limit' must be between 1 and {STATS_TOP_MAX}", status_code=400)
+    return limit
+
+
+def top_favorited(kind, args):
+    if kind not in KINDS:
+        raise APIException(f"unknown stats kind '{kind}'", status_code=404,
+                           payload={"kinds": list(KINDS)})
+    limit = top_limit(args)
+    _, model, field = KINDS[kind]
+
+    def load():
+        pk = model.__mapper__.primary_key[0]
+        rows = db.session.execute(
+            db.select(FavoriteCount.item_id, getattr(model, model.api_fields[field]).label("label"),
+                      FavoriteCount.total)
+            .join(model, pk == FavoriteCount.item_id)
+            .where(FavoriteCount.kind == kind, FavoriteCount.total > 0)
+            .order_by(FavoriteCount.total.desc(), FavoriteCount.item_id)
+            .limit(limit)
+        )
+        return {kind: [{"id": row.item_id, field: row.label, "favorites": row.total} for row in rows]}
+
+    # counts change with "favorites", the names with the kind's own table
+    return catalog_cache.get_or_load("favorites", f"top:{kind}:{limit}:{catalog_cache.version(kind)}", load)
+
+
+def person_counts(args):
+    limit, after, _ = page_args(Person, args)
+
+    def load():
+        stmt = db.select(FavoriteCount.item_id, FavoriteCount.total).where(
+            FavoriteCount.kind == "persons", FavoriteCount.total > 0)
+        if after is not None:
+            stmt = stmt.where(FavoriteCount.item_id > after)
+        rows, has_more = split_page(db.session.execute(stmt.order_by(FavoriteCount.item_id).limit(limit + 1)).all(), limit)
+        return {"persons": [{"person_id": row.item_id, "favorites": row.total} for row in rows],
+                "next": rows[-1].item_id if has_more else None}
+
+    return catalog_cache.get_or_load("favorites", f"persons:{limit}:{after}", load)
+
+
+stats_cli = AppGroup("stats", help="Maintain the favorite_counts table.")
+
+
+def rebuild_counts(session):
+    """Recomputes favorite_counts from the favorites table, the caller commits."""
+    session.execute(db.delete(FavoriteCount))
+    for kind, (column, _, _) in KINDS.items():
+        session.execute(db.insert(FavoriteCount.__table__).from_select(
+            ["kind", "item_id", "total"],
+            db.select(literal(kind), column, func.count()).where(column.isnot(None)).group_by(column)))
+    touch(session, "favorites")
+
+
+@stats_cli.command("rebuild")
+def rebuild():
+    """Recomputes favorite_counts from the favorites table."""
+    session = db.session
+    rebuild_counts(session)
+    session.commit()
+    click.echo(f"favorite_counts rebuilt: {session.scalar(db.select(func.count()).select_from(FavoriteCount))} rows")
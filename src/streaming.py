@@ -0,0 +1,36 @@
+"""
+NDJSON export mode for the collection endpoints.
+
+    GET /persons?stream=1
+    GET /favorites   (Accept: application/x-ndjson)
+
+Rows are read through a server side cursor (yield_per) and written one JSON
+document per line, so memory stays flat whatever the size of the table.
+"""
+import os
+from flask import Response, current_app, request, stream_with_context
+from models import db
+
+NDJSON = "application/x-ndjson"
+STREAM_BATCH_SIZE = int(os.getenv("API_STREAM_BATCH_SIZE", 1000))
+
+
+def wants_stream():
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    return request.accept_mimetypes.best == NDJSON
+
+
+def stream_rows(stmt, serializer):
+    """`stmt` rows serialized by one of the serializers in serializers.py, as NDJSON."""
+    dumps = current_app.json.dumps
+
+    def generate():
+        result = db.session.execute(stmt, execution_options={"yield_per": STREAM_BATCH_SIZE})
+        for partition in result.partitions():
+            related = serializer.related_select(partition)
+            related = db.session.execute(related).all() if related is not None else None
+            # one write per batch instead of one per row
+            yield "".join(dumps(item) + "\n" for item in serializer.serialize_rows(partition, related))
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
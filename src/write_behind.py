@@ -0,0 +1,236 @@
+"""
+Write-behind mode of POST /favorites/register and DELETE /favorites.
+
+    FAVORITES_WRITE_BEHIND=1
+
+The routes validate the request, queue the mutation and answer 202 without
+waiting for a commit. A thread per worker applies the queue in batches, one
+transaction per batch, when WRITE_BEHIND_BATCH_SIZE mutations are waiting or the
+oldest one has waited WRITE_BEHIND_FLUSH_MS. A batch is replayed in the order the
+worker accepted its mutations on the current favorites of its persons, and only
+the net change is written: one INSERT and one DELETE whatever the batch holds, a
+favorite registered and deleted again within it is never written at all.
+
+Duplicates and missing favorites are found when the batch is applied. A failed
+transaction is retried WRITE_BEHIND_RETRIES times with a backoff, then its
+mutations are given up. GET /metrics shows the queue, the commits and the
+failures with the last error.
+
+Durability: `?wait=1` keeps the request until its batch is committed and answers
+like the synchronous route (200, 404, 409 or 500); concurrent waiting requests
+still share one commit. Without it a mutation queued in a worker that is killed
+before the next flush is lost, and ordering only holds within a worker: a client
+whose next request depends on the previous one should wait for it. A worker that
+exits normally flushes its queue first. With a full queue (WRITE_BEHIND_MAX_PENDING)
+the routes answer 503.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from flask import request
+from utils import APIException
+from flags import env_flag
+from models import db
+from favorites import FIELDS, favorites_of, found_references, reference_error, insert_rows, delete_rows
+
+WRITE_BEHIND = env_flag("FAVORITES_WRITE_BEHIND", "0")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", 20))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10000))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", 3))
+WRITE_BEHIND_WAIT_TIMEOUT = float(os.getenv("WRITE_BEHIND_WAIT_TIMEOUT", 10))
+
+
+class Mutation:
+    __slots__ = ("seq", "op", "key", "queued_at", "result", "done")
+
+    def __init__(self, seq, op, key):
+        self.seq = seq
+        self.op = op
+        self.key = key
+        self.queued_at = time.monotonic()
+        self.result = None
+        self.done = threading.Event()
+
+    def wait(self, timeout):
+        """{"status": ..., "error": ...} once applied, None if it is still queued after `timeout`."""
+        return self.result if self.done.wait(timeout) else None
+
+
+class WriteBehind:
+    """The queue of this process and the thread that applies it."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._seq = 0
+        self._applied = 0
+        self._flushing = False
+        self._worker_pid = None
+        self.app = None
+        self.stats = {"accepted": 0, "applied": 0, "rejected": 0, "failed": 0,
+                      "commits": 0, "retries": 0}
+        self.last_error = None
+
+    def ensure_worker(self):
+        if self._worker_pid != os.getpid():
+            with self._cond:
+                if self._worker_pid != os.getpid():
+                    self._queue.clear()
+                    self._worker_pid = os.getpid()
+                    threading.Thread(target=self.run, name="write-behind", daemon=True).start()
+                    atexit.register(self.flush)
+
+    def submit(self, op, key):
+        """Queues a mutation, None when the queue is full."""
+        self.ensure_worker()
+        with self._cond:
+            if len(self._queue) >= WRITE_BEHIND_MAX_PENDING:
+                return None
+            self._seq += 1
+            mutation = Mutation(self._seq, op, key)
+            self._queue.append(mutation)
+            self.stats["accepted"] += 1
+            if len(self._queue) == 1 or len(self._queue) >= WRITE_BEHIND_BATCH_SIZE:
+                self._cond.notify_all()
+        return mutation
+
+    def flush(self, timeout=WRITE_BEHIND_WAIT_TIMEOUT):
+        """Waits until the mutations queued so far are applied, False on timeout."""
+        with self._cond:
+            target = self._seq
+            if self._applied >= target or self._worker_pid != os.getpid():
+                return True
+            self._flushing = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._applied >= target, timeout)
+
+    def next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._flushing = False
+                self._cond.wait()
+            deadline = self._queue[0].queued_at + WRITE_BEHIND_FLUSH_MS / 1000
+            while len(self._queue) < WRITE_BEHIND_BATCH_SIZE and not self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(len(self._queue), WRITE_BEHIND_BATCH_SIZE))]
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                with self.app.app_context():
+                    self.apply(batch)
+            except Exception as e:
+                # never leave waiters hanging, nor the thread dead
+                self.fail(batch, e)
+            with self._cond:
+                self._applied = batch[-1].seq
+                self._cond.notify_all()
+
+    def apply(self, batch):
+        for attempt in range(WRITE_BEHIND_RETRIES + 1):
+            try:
+                results = self.write(batch)
+                break
+            except Exception as e:
+                db.session.rollback()
+                if attempt == WRITE_BEHIND_RETRIES:
+                    self.fail(batch, e)
+                    return
+                self.stats["retries"] += 1
+                time.sleep(0.05 * 2 ** attempt)
+        self.stats["commits"] += 1
+        for mutation, result in zip(batch, results):
+            self.stats["applied" if result["status"] == 200 else "rejected"] += 1
+            mutation.result = result
+            mutation.done.set()
+
+    def write(self, batch):
+        """Applies `batch` in one transaction, the result of every mutation in batch order."""
+        found = found_references([m.key for m in batch if m.op == "register"])
+        # favorite key -> favorite_id, None for the ones this batch inserts
+        state = favorites_of({m.key[0] for m in batch})
+        # inserts: favorite key -> index of the mutation inserting it,
+        # deleting: favorite_id -> index of the mutation deleting it
+        inserts, deletes, deleting, results = {}, {}, {}, []
+        for mutation in batch:
+            key, item = mutation.key, dict(zip(FIELDS, mutation.key))
+            if mutation.op == "register":
+                error = reference_error(item, found)
+                if error:
+                    results.append({"status": 404, "error": error})
+                elif key in state:
+                    results.append({"status": 409, "error": "favorite already registered"})
+                else:
+                    state[key] = None
+                    inserts[key] = len(results)
+                    results.append({"status": 200})
+            elif key not in state:
+                results.append({"status": 404, "error": "Favorite not found with ID provided"})
+            else:
+                favorite_id = state.pop(key)
+                if favorite_id is None:
+                    del inserts[key]
+                else:
+                    deletes[favorite_id] = item
+                    deleting[favorite_id] = len(results)
+                results.append({"status": 200})
+        # deletes first: a favorite deleted and registered again gets a new row
+        if deletes:
+            deleted = delete_rows(deletes)
+            # deleted meanwhile by another worker or the synchronous routes
+            for favorite_id, index in deleting.items():
+                if favorite_id not in deleted:
+                    results[index] = {"status": 404, "error": "Favorite not found with ID provided"}
+        if inserts:
+            written = insert_rows([dict(zip(FIELDS, key)) for key in inserts])
+            # registered meanwhile by another worker or the synchronous routes
+            for key, index in inserts.items():
+                if key not in written:
+                    results[index] = {"status": 409, "error": "favorite already registered"}
+        db.session.commit()
+        return results
+
+    def fail(self, batch, error):
+        print("Error applying the queued favorites:", error)
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.stats["failed"] += len(batch)
+        for mutation in batch:
+            mutation.result = {"status": 500, "error": "Sorry, there was a server error"}
+            mutation.done.set()
+
+    def status(self):
+        with self._cond:
+            pending = len(self._queue)
+        return {"pending": pending, **self.stats, "last_error": self.last_error}
+
+
+write_behind = WriteBehind()
+
+
+def install_write_behind(app):
+    write_behind.app = app
+
+
+def wants_wait():
+    return request.args.get("wait", "").lower() in ("1", "true", "yes")
+
+
+def enqueue(op, key):
+    """Queues the mutation `op` of the favorite `key` (person_id, character_id, planet_id,
+    vehicle_id). Returns its result when the request asked to wait for it, otherwise None."""
+    mutation = write_behind.submit(op, key)
+    if mutation is None:
+        raise APIException("too many queued writes, try again later", status_code=503)
+    if not wants_wait():
+        return None
+    # the request's reads are done, it must not keep a pooled connection (on SQLite
+    # a read lock) while the batch it waits for commits
+    db.session.close()
+    return mutation.wait(WRITE_BEHIND_WAIT_TIMEOUT)
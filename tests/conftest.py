@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# the app reads its configuration at import
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["RATE_LIMIT_PER_SECOND"] = "0"
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+
+from seed import app, seed  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from models import db  # noqa: E402
+from cache import catalog_cache  # noqa: E402
+from conditional import response_cache  # noqa: E402
+from catalog_snapshot import catalog_snapshot  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded():
+    """Seeds persons, catalog rows and favorites, seeded(persons=..., ...)."""
+    def reseed(*args, **kwargs):
+        seed(*args, **kwargs)
+        # the tables were recreated, their versions start again from 0
+        catalog_cache.local.clear()
+        response_cache.clear()
+        catalog_snapshot.clear()
+    return reseed
+
+
+@pytest.fixture
+def queries():
+    """The statements run against the database while the test runs."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
@@ -0,0 +1,36 @@
+from flask import g
+
+from app import app
+from models import db
+
+
+def batch(client, *requests):
+    response = client.post("/batch", json={"requests": list(requests)})
+    assert response.status_code == 200
+    return response.get_json()["results"]
+
+
+def test_items_match_the_item_routes(client, seeded):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    results = batch(client, {"type": "person", "id": 2}, {"type": "character", "id": 3},
+                    {"type": "planet", "id": 99})
+    assert results[0]["Person"] == client.get("/person/2").get_json()["Person"]
+    assert results[1]["character"] == client.get("/character/3").get_json()["character"]
+    assert results[2] == {"index": 2, "status": 404, "error": "planet not found"}
+
+
+def test_catalog_lookups_use_the_catalog_cache(client, seeded, queries):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    client.get("/character/1")
+    batch(client, {"type": "character", "id": 2})
+    queries.clear()
+    results = batch(client, {"type": "character", "id": 1}, {"type": "character", "id": 2})
+    assert [result["status"] for result in results] == [200, 200]
+    assert not [statement for statement in queries if "characters" in statement]
+
+
+def test_batch_reads_like_a_get():
+    with app.test_request_context("/batch", method="POST"):
+        assert db.session().read_request()[0] == "POST"
+        g.read_only = True
+        assert db.session().read_request()[0] == "GET"
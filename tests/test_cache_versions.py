@@ -0,0 +1,49 @@
+"""
+A write committed by another process (another gunicorn worker, Flask-Admin in
+another worker, a shell) invalidates this process's catalog cache and ETags at
+once: the table versions live in the cache_versions table.
+"""
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RENAME = """
+import sys
+sys.path.insert(0, {src!r})
+from app import app
+from models import db, Character
+with app.app_context():
+    db.session.get(Character, 1).character_name = "Renamed"
+    db.session.commit()
+"""
+
+
+def rename_in_another_process():
+    code = RENAME.format(src=os.path.join(HERE, "..", "src"))
+    subprocess.run([sys.executable, "-c", code], check=True, env=os.environ)
+
+
+def test_write_in_another_process_invalidates(client, seeded):
+    seeded(persons=1, catalog=3, favorites_per_person=0)
+    assert client.get("/character/1").get_json()["character"]["name"] == "Character 1"
+    etag = client.get("/characters").headers["ETag"]
+
+    rename_in_another_process()
+
+    assert client.get("/character/1").get_json()["character"]["name"] == "Renamed"
+    response = client.get("/characters", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.get_json()["characters"][0]["name"] == "Renamed"
+
+
+def test_request_snapshot_ends_with_the_request(client, seeded):
+    from cache import request_versions
+
+    seeded(persons=1, catalog=3, favorites_per_person=0)
+    client.get("/characters")
+    assert request_versions.get() is None
+    client.get("/character/99")
+    assert request_versions.get() is None
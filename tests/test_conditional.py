@@ -0,0 +1,50 @@
+import time
+
+from app import app
+from models import db, Character
+from werkzeug.http import http_date
+
+
+def rename(name):
+    with app.app_context():
+        db.session.get(Character, 1).character_name = name
+        db.session.commit()
+
+
+def test_revalidation(client, seeded):
+    seeded(persons=1, catalog=3, favorites_per_person=0)
+    rename("Written now")
+    # written within the current second: no date a later write could share
+    response = client.get("/characters")
+    assert "Last-Modified" not in response.headers
+    response = client.get("/characters", headers={"If-Modified-Since": http_date(time.time())})
+    assert response.status_code == 200
+
+    time.sleep(1.1 - time.time() % 1)
+    response = client.get("/characters")
+    modified = response.headers["Last-Modified"]
+    assert client.get("/characters", headers={"If-Modified-Since": modified}).status_code == 304
+    assert client.get("/characters", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    rename("Written later")
+    response = client.get("/characters", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.get_json()["characters"][0]["name"] == "Written later"
+    assert client.get("/characters", headers={"If-Modified-Since": modified}).status_code == 200
+
+
+def test_representations_do_not_share_etags(client, seeded):
+    seeded(persons=1, catalog=3, favorites_per_person=0)
+    response = client.get("/characters")
+    assert "Accept" in response.headers["Vary"]
+    etag = response.headers["ETag"]
+
+    ndjson = {"Accept": "application/x-ndjson"}
+    response = client.get("/characters", headers={**ndjson, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["ETag"] != etag
+    assert "Accept" in response.headers["Vary"]
+    assert client.get("/characters", headers={**ndjson, "If-None-Match": response.headers["ETag"]}).status_code == 304
+    # and the JSON page is still served as JSON from the response cache
+    assert client.get("/characters").mimetype == "application/json"
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import favorites
+from favorites import unique_violation
+
+
+def test_duplicate_registration(client, seeded):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    body = {"person_id": 1, "character_id": 2}
+    assert client.post("/favorites/register", json=body).status_code == 200
+    response = client.post("/favorites/register", json=body)
+    assert response.status_code == 409
+    assert "already registered" in response.get_json()["error"]
+
+
+def test_bulk_reports_rows_dropped_by_the_unique_index(client, seeded, monkeypatch):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    assert client.post("/favorites/register", json={"person_id": 1, "character_id": 2}).status_code == 200
+    # a concurrent request inserts the favorite between the check and the insert
+    monkeypatch.setattr(favorites, "favorites_of", lambda person_ids: {})
+    response = client.post("/favorites/bulk", json={"favorites": [
+        {"person_id": 1, "character_id": 2},
+        {"person_id": 1, "character_id": 3},
+    ]})
+    statuses = [item["status"] for item in response.get_json()["results"]]
+    assert statuses == [409, 200]
+
+
+def test_bulk_delete_reports_rows_deleted_concurrently(client, seeded, monkeypatch):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    assert client.post("/favorites/register", json={"person_id": 1, "character_id": 3}).status_code == 200
+    lookup = favorites.favorites_of
+    # a concurrent request deletes favorite 999 between the lookup and the delete
+    monkeypatch.setattr(favorites, "favorites_of",
+                        lambda person_ids: {**lookup(person_ids), (1, 2, None, None): 999})
+    response = client.delete("/favorites/bulk", json={"favorites": [
+        {"person_id": 1, "character_id": 2},
+        {"person_id": 1, "character_id": 3},
+    ]})
+    statuses = [item["status"] for item in response.get_json()["results"]]
+    assert statuses == [404, 200]
+
+
+def integrity_error(sql):
+    connection = sqlite3.connect(":memory:")
+    connection.executescript("PRAGMA foreign_keys = ON;"
+                             "CREATE TABLE parent (id INTEGER PRIMARY KEY, name TEXT UNIQUE);"
+                             "CREATE TABLE child (id INTEGER PRIMARY KEY, parent_id INTEGER REFERENCES parent(id));"
+                             "INSERT INTO parent VALUES (1, 'a');")
+    with pytest.raises(sqlite3.IntegrityError) as raised:
+        connection.execute(sql)
+    return IntegrityError(sql, {}, raised.value)
+
+
+def test_unique_violation():
+    assert unique_violation(integrity_error("INSERT INTO parent VALUES (2, 'a')"))
+    assert unique_violation(integrity_error("INSERT INTO parent VALUES (1, 'b')"))
+    assert not unique_violation(integrity_error("INSERT INTO child VALUES (1, 7)"))
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import idempotency
+from app import app
+from models import db, Favorite
+
+THREADS = 8
+
+
+def favorites_count():
+    with app.app_context():
+        return db.session.scalar(db.select(db.func.count()).select_from(Favorite))
+
+
+def test_concurrent_duplicates_run_once(client, seeded, monkeypatch):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    store = idempotency.store
+
+    def slow_store(route, key, response):
+        # keeps the key in progress while the duplicates arrive
+        time.sleep(0.3)
+        store(route, key, response)
+    monkeypatch.setattr(idempotency, "store", slow_store)
+
+    barrier = threading.Barrier(THREADS)
+    statuses = []
+
+    def post():
+        barrier.wait()
+        response = app.test_client().post("/favorites/register", json={"person_id": 1, "character_id": 2},
+                                          headers={"Idempotency-Key": "same-key"})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] + [409] * (THREADS - 1)
+    assert favorites_count() == 1
+
+
+def test_retry_replays_the_stored_response(client, seeded):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    headers = {"Idempotency-Key": "retried-key"}
+    body = {"person_id": 1, "character_id": 3}
+    first = client.post("/favorites/register", json=body, headers=headers)
+    retry = client.post("/favorites/register", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_data() == first.get_data()
+    assert favorites_count() == 1
+
+    other = client.post("/favorites/register", json={"person_id": 2, "character_id": 3}, headers=headers)
+    assert other.status_code == 422
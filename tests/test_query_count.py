@@ -0,0 +1,29 @@
+"""
+The list routes run a fixed number of queries per page, whatever the number of
+persons and favorites: a regression to one query per row (N+1) fails here.
+"""
+import pytest
+
+N = 20
+
+
+def page_queries(client, queries, url):
+    client.get(url)  # warms the caches a first request fills
+    queries.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+# the cache versions (cache.py), then the page and its favorites / the page; the
+# catalog rows come from catalog_snapshot.py
+EXPECTED = {"/persons": 3, "/favorites": 2}
+
+
+@pytest.mark.parametrize("url", list(EXPECTED))
+def test_queries_do_not_grow_with_the_rows(client, seeded, queries, url):
+    seeded(persons=N, catalog=10, favorites_per_person=3)
+    small = page_queries(client, queries, url)
+    seeded(persons=10 * N, catalog=10, favorites_per_person=3)
+    large = page_queries(client, queries, url)
+    assert small == large == EXPECTED[url]
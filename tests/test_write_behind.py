@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import app as app_module
+import write_behind as write_behind_module
+from app import app
+from models import db, Favorite
+from write_behind import write_behind
+
+THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    # FAVORITES_WRITE_BEHIND is read at import
+    monkeypatch.setattr(app_module, "WRITE_BEHIND", True)
+
+
+def favorites_of(person_id):
+    with app.app_context():
+        return db.session.execute(db.select(Favorite.character_id).where(Favorite.person_id == person_id)).all()
+
+
+def concurrently(request):
+    barrier = threading.Barrier(THREADS)
+    statuses = []
+
+    def run():
+        barrier.wait()
+        statuses.append(request(app.test_client()).status_code)
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(statuses)
+
+
+def test_waiting_duplicates_share_a_commit(seeded):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    commits = write_behind.stats["commits"]
+    statuses = concurrently(lambda client: client.post("/favorites/register?wait=1",
+                                                       json={"person_id": 1, "character_id": 2}))
+    assert statuses == [200] + [409] * (THREADS - 1)
+    assert favorites_of(1) == [(2,)]
+    assert write_behind.stats["commits"] - commits < THREADS
+
+
+def test_mutations_apply_in_order(client, seeded):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    body = {"person_id": 2, "character_id": 1}
+    assert client.post("/favorites/register", json=body).status_code == 202
+    assert client.delete("/favorites", json=body).status_code == 202
+    assert client.post("/favorites/register", json=body).status_code == 202
+    assert write_behind.flush()
+    assert favorites_of(2) == [(1,)]
+
+
+def test_failed_batch_answers_500(client, seeded, monkeypatch):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+
+    def broken(batch):
+        raise RuntimeError("database down")
+    monkeypatch.setattr(write_behind, "write", broken)
+    monkeypatch.setattr(write_behind_module, "WRITE_BEHIND_RETRIES", 1)
+    failed = write_behind.stats["failed"]
+    response = client.post("/favorites/register?wait=1", json={"person_id": 1, "character_id": 3})
+    assert response.status_code == 500
+    assert write_behind.stats["failed"] == failed + 1
+    assert "database down" in write_behind.status()["last_error"]
+    assert favorites_of(1) == []
+
+
+def test_delete_applied_after_a_concurrent_one_answers_404(client, seeded, monkeypatch):
+    seeded(persons=2, catalog=3, favorites_per_person=0)
+    # the synchronous routes deleted favorite 999 before the batch applied
+    monkeypatch.setattr(write_behind_module, "favorites_of", lambda person_ids: {(2, 1, None, None): 999})
+    response = client.delete("/favorites?wait=1", json={"person_id": 2, "character_id": 1})
+    assert response.status_code == 404